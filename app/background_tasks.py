@@ -1,11 +1,19 @@
+import time
 from datetime import datetime, timezone
 from sqlalchemy.orm import sessionmaker
+from app.config import REPORT_PROGRESS_INTERVAL
 from app.database import engine
+from app.events import event_bus, report_event, notify_report_finished
 from app.models import ReportStatus
-from app.report_generator import generate_report
 
 def generate_report_async(report_id: str):
-    """Run report generation in a background thread for the given report_id"""
+    """
+    Run report generation for the given report_id and mark it Complete/Error.
+    Called by app.worker after it claims the job, or from a thread in the API when REPORT_EXECUTION=thread.
+    Progress writes double as the heartbeat that keeps the job from being re-queued as stale.
+    Every write is conditional on the claim (status Running, same attempts), so a run whose job
+    was re-queued and claimed by another worker stops and never marks it Complete/Error.
+    """
     print(f"🔄 Starting background report generation for {report_id}")
     
         
@@ -17,26 +25,73 @@ def generate_report_async(report_id: str):
         report = session.query(ReportStatus).filter(ReportStatus.report_id == report_id).first()
         
         if report:
+            # this claim only: a report re-queued as stale and claimed again is finished by its new owner
+            attempt = report.attempts
+            still_claimed = session.query(ReportStatus).filter(
+                ReportStatus.report_id == report_id,
+                ReportStatus.status == "Running",
+                ReportStatus.attempts == attempt
+            )
+            # the row is only written through still_claimed, changes to this copy are never flushed
+            session.expunge(report)
+
+            def finish(values: dict) -> bool:
+                """Write the final status if this claim still holds the report, notify subscribers if it did"""
+                finished = still_claimed.update(values, synchronize_session=False)
+                session.commit()
+                if finished != 1:
+                    print(f"⚠️ Report {report_id} was re-queued meanwhile, result of this run dropped")
+                    return False
+                for column, value in values.items():
+                    setattr(report, column.key, value)
+                notify_report_finished(report)
+                return True
+
             try:
                 print(f"📊 Generating actual report for {report_id}...")
+
+                # imported here so pandas/numpy only get loaded once a report actually runs
+                from app.report_generator import generate_report
                 
+                last_write = [0.0]
+
+                def on_progress(stores_processed, stores_total):
+                    # in-process subscribers (thread mode) get every batch,
+                    # the DB row (progress + heartbeat) is only updated every REPORT_PROGRESS_INTERVAL seconds
+                    report.stores_processed = stores_processed
+                    report.stores_total = stores_total
+                    event_bus.publish(report_id, report_event(report))
+                    if time.monotonic() - last_write[0] >= REPORT_PROGRESS_INTERVAL:
+                        held = still_claimed.update({
+                            ReportStatus.stores_processed: stores_processed,
+                            ReportStatus.stores_total: stores_total,
+                            ReportStatus.heartbeat_at: datetime.now(timezone.utc),
+                        }, synchronize_session=False)
+                        session.commit()
+                        last_write[0] = time.monotonic()
+                        if held != 1:
+                            # stop early, another worker is running the report now
+                            raise RuntimeError(f"report {report_id} is no longer claimed by this run")
+
                 # creates the report file
-                file_path = generate_report()
+                file_path = generate_report(report_id, progress_callback=on_progress)
                 
                 # Mark report as complete and update fields
-                report.status = "Complete"
-                report.completed_at = datetime.now(timezone.utc)
-                report.file_path = file_path
-                
-                session.commit()
-                print(f"✅ Background report {report_id} completed! File: {file_path}")
+                if finish({
+                    ReportStatus.status: "Complete",
+                    ReportStatus.completed_at: datetime.now(timezone.utc),
+                    ReportStatus.file_path: file_path,
+                }):
+                    print(f"✅ Background report {report_id} completed! File: {file_path}")
                 
             except Exception as e:
                 # If report generation fails, mark as Error
-                report.status = "Error"
-                report.completed_at = datetime.now(timezone.utc)
-                session.commit()
-                print(f"❌ Background report {report_id} failed: {e}")
+                session.rollback()
+                if finish({
+                    ReportStatus.status: "Error",
+                    ReportStatus.completed_at: datetime.now(timezone.utc),
+                }):
+                    print(f"❌ Background report {report_id} failed: {e}")
         
     except Exception as e:
         print(f"Database error in background task: {e}")
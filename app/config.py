@@ -5,3 +5,36 @@ from dotenv import load_dotenv
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///store_monitoring.db")
+
+# Retention settings for raw store_status polls.
+# Reports only look back 168 hours, so polls older than the horizon are
+# rolled up into hourly aggregates and removed from store_status.
+RETENTION_HOURS = int(os.getenv("RETENTION_HOURS", "192"))
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() == "true"  # keep a copy of deleted raw polls
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "data/archive")
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "50000"))  # rows per archive file
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "0"))  # pages freed per incremental vacuum, 0 = all
+
+# Report execution settings.
+# "worker" = API only enqueues, reports are run by `python -m app.worker` processes
+# "thread" = old behaviour, report runs in a thread inside the API process
+REPORT_EXECUTION = os.getenv("REPORT_EXECUTION", "worker")
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "2"))  # seconds between queue checks when idle
+REPORT_JOB_TIMEOUT = int(os.getenv("REPORT_JOB_TIMEOUT", "3600"))  # seconds without a heartbeat before a Running job is re-queued
+
+# Distributed report settings.
+# REPORT_SHARDS > 1 splits every report into shards by store_id hash, any worker
+# on any node can process a shard. REPORT_SHARED_DIR must be visible to all nodes.
+REPORT_SHARDS = int(os.getenv("REPORT_SHARDS", "1"))
+REPORT_SHARED_DIR = os.getenv("REPORT_SHARED_DIR", "reports")
+SHARD_MAX_ATTEMPTS = int(os.getenv("SHARD_MAX_ATTEMPTS", "3"))  # tries per shard before the report fails
+
+# Report notification settings (server-sent events, long polling, webhooks)
+REPORT_EVENTS_POLL_INTERVAL = float(os.getenv("REPORT_EVENTS_POLL_INTERVAL", "1"))  # seconds between status checks for watched reports
+REPORT_PROGRESS_INTERVAL = float(os.getenv("REPORT_PROGRESS_INTERVAL", "2"))  # min seconds between progress writes
+REPORT_LONG_POLL_MAX = float(os.getenv("REPORT_LONG_POLL_MAX", "60"))  # max `wait` for GET /get_report
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "5"))
+WEBHOOK_RETRIES = int(os.getenv("WEBHOOK_RETRIES", "3"))
+# comma separated hosts a callback_url may point to, webhooks are disabled when empty
+WEBHOOK_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()}
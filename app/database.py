@@ -1,21 +1,127 @@
-from sqlalchemy import create_engine
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, inspect, func, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker
-from app.models import Base
+from app.models import Base, SchemaVersion, SCHEMA_VERSION
 from app.config import DATABASE_URL
 
 
 # Create database engine using the connection URL
-# same_thread=False allows SQLite to be used in multi-threaded apps
-engine = create_engine(DATABASE_URL, echo=False, connect_args={"check_same_thread": False})
+# same_thread=False allows SQLite to be used in multi-threaded apps,
+# timeout makes SQLite wait for locks held by other processes (API + workers) instead of failing
+connect_args = {"check_same_thread": False, "timeout": 30} if DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(DATABASE_URL, echo=False, connect_args=connect_args)
 
 # Session factory to interact with the database
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def create_tables():
+# set once the schema has been checked in this process
+_schema_ready = False
+
+# key of the PostgreSQL advisory lock that serializes schema upgrades
+SCHEMA_LOCK_KEY = 72450028
+
+def create_tables(conn):
     """Create all tables defined in models"""
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=conn)
     print("Database tables created successfully!")
 
+def upgrade_tables(conn):
+    """
+    Bring tables that already exist up to date with the models.
+    create_all() only creates missing tables, so new nullable columns
+    and new indexes on existing tables are added here.
+    """
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                col_type = column.type.compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}")
+                print(f"Added column {table.name}.{column.name}")
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+def get_schema_version(conn=None):
+    """Return the schema version stored in the database, None for a fresh database"""
+    if conn is None:
+        with engine.connect() as conn:
+            return get_schema_version(conn)
+    if not inspect(conn).has_table(SchemaVersion.__tablename__):
+        return None
+    return conn.execute(func.max(SchemaVersion.version).select()).scalar()
+
+def _lock_schema(conn):
+    """
+    Serialize schema upgrades between processes (API + several workers starting at once).
+    SQLite: BEGIN IMMEDIATE takes the database write lock, DDL is transactional.
+    PostgreSQL: transaction level advisory lock, released on commit.
+    """
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({SCHEMA_LOCK_KEY})")
+
+def ensure_schema():
+    """
+    Create/upgrade tables only when the stored schema version does not match SCHEMA_VERSION.
+    The upgrade runs in one locked transaction and the version is checked again once
+    the lock is held, so processes starting together upgrade the schema only once.
+    The check is cached per process, so calling it again is free.
+    Returns True if the schema was (re)applied.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return False
+
+    if get_schema_version() == SCHEMA_VERSION:
+        _schema_ready = True
+        return False
+
+    if engine.dialect.name == "sqlite":
+        # incremental auto vacuum lets the retention job give space back to the OS.
+        # it only takes effect on a new database, before any table is created
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+
+    applied = False
+    with engine.connect() as conn:
+        with conn.begin():
+            _lock_schema(conn)
+            # another process may have upgraded while we waited for the lock
+            if get_schema_version(conn) != SCHEMA_VERSION:
+                create_tables(conn)
+                upgrade_tables(conn)
+                stmt = insert_for_dialect(SchemaVersion.__table__).values(
+                    version=SCHEMA_VERSION, applied_at=datetime.now(timezone.utc)
+                )
+                conn.execute(stmt.on_conflict_do_nothing(index_elements=["version"]))
+                applied = True
+
+    if applied:
+        print(f"Database schema upgraded to version {SCHEMA_VERSION}")
+    _schema_ready = True
+    return applied
+
+def insert_for_dialect(table):
+    """INSERT construct of the current dialect, these support ON CONFLICT upserts"""
+    if engine.dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
+
+def begin_write(session):
+    """
+    Start a write transaction right away instead of at the first write.
+    On SQLite this takes the database write lock (BEGIN IMMEDIATE), so reads
+    made before the writes can't be invalidated by another writer.
+    On PostgreSQL the caller locks the rows it reads with SELECT ... FOR UPDATE.
+    """
+    session.commit()  # end whatever the session was doing before
+    if session.get_bind().dialect.name == "sqlite":
+        session.execute(text("BEGIN IMMEDIATE"))
+
 def get_db():
     """Provide a database session for queries"""
     db = SessionLocal()
@@ -26,4 +132,4 @@ def get_db():
 
 # Run table creation only if this file is executed directly
 if __name__ == "__main__":
-    create_tables()
+    ensure_schema()
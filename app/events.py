@@ -0,0 +1,182 @@
+import asyncio
+import json
+import threading
+import time
+import urllib.request
+from urllib.parse import urlparse
+
+from app.config import REPORT_EVENTS_POLL_INTERVAL, WEBHOOK_TIMEOUT, WEBHOOK_RETRIES, WEBHOOK_ALLOWED_HOSTS
+from app.database import SessionLocal
+from app.models import ReportStatus
+
+# statuses after which a report never changes again
+FINISHED_STATUSES = ("Complete", "Error")
+
+
+def report_event(report) -> dict:
+    """Event payload for a ReportStatus row (same status names as /get_report)"""
+    status = "Running" if report.status == "Merging" else report.status
+    event = {
+        "report_id": report.report_id,
+        "status": status,
+        "stores_processed": report.stores_processed,
+        "stores_total": report.stores_total,
+        "completed_at": report.completed_at,
+    }
+    if status == "Complete":
+        event["download_path"] = f"/get_report?report_id={report.report_id}"
+    return event
+
+
+class ReportEventBus:
+    """
+    In-process pub/sub for report progress and completion.
+    Subscribers are asyncio queues (one per SSE client / long poll request),
+    publish() can be called from any thread, e.g. the report thread or the watcher.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # report_id -> set of (loop, queue)
+        self._last_event = {}  # report_id -> last published event, used to skip duplicates
+
+    def subscribe(self, report_id: str) -> asyncio.Queue:
+        """Subscribe the running event loop to events of one report"""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(report_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, report_id: str, queue: asyncio.Queue):
+        """Remove a subscriber, forget the report once nobody listens any more"""
+        with self._lock:
+            subscribers = self._subscribers.get(report_id, set())
+            subscribers.difference_update({item for item in subscribers if item[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(report_id, None)
+                self._last_event.pop(report_id, None)
+
+    def subscribed_report_ids(self) -> list:
+        """Reports that currently have at least one subscriber"""
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, report_id: str, event: dict):
+        """
+        Send an event to every subscriber of the report, unless it equals the last one sent
+        or reports less progress in the same status. In thread mode the report thread publishes
+        every batch while the watcher reads the progress committed earlier, which is older.
+        """
+        with self._lock:
+            last = self._last_event.get(report_id)
+            if last == event:
+                return
+            if last and last["status"] == event["status"] and \
+                    (event["stores_processed"] or 0) < (last["stores_processed"] or 0):
+                return
+            subscribers = list(self._subscribers.get(report_id, ()))
+            if subscribers:
+                self._last_event[report_id] = event
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                pass  # event loop already closed
+
+
+# one bus per process, shared by the API endpoints, the watcher and report threads
+event_bus = ReportEventBus()
+
+
+def load_report_events(report_ids: list) -> list:
+    """Current state of the given reports, in one query"""
+    session = SessionLocal()
+    try:
+        return [
+            report_event(report)
+            for report in session.query(ReportStatus).filter(ReportStatus.report_id.in_(report_ids))
+        ]
+    finally:
+        session.close()
+
+
+async def watch_report_status(poll_interval: float = REPORT_EVENTS_POLL_INTERVAL):
+    """
+    Background task of the API process.
+    Reports generated by `python -m app.worker` processes can't publish to this
+    process's bus, so the watcher reads the status of every report that has
+    subscribers with one query per interval and publishes what changed.
+    It only queries while somebody is listening, however many clients there are.
+    """
+    while True:
+        await asyncio.sleep(poll_interval)
+        report_ids = event_bus.subscribed_report_ids()
+        if not report_ids:
+            continue
+        try:
+            for event in await asyncio.to_thread(load_report_events, report_ids):
+                event_bus.publish(event["report_id"], event)
+        except Exception as e:
+            print(f"Error watching report status: {e}")
+
+
+async def wait_for_report_finish(queue: asyncio.Queue, timeout: float):
+    """Wait on a subscription until the report is Complete/Error or the timeout expires"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return None
+        try:
+            event = await asyncio.wait_for(queue.get(), remaining)
+        except asyncio.TimeoutError:
+            return None
+        if event["status"] in FINISHED_STATUSES:
+            return event
+
+
+def webhook_url_allowed(url: str) -> bool:
+    """
+    Only http(s) URLs whose host is in WEBHOOK_ALLOWED_HOSTS, so API callers can't
+    make the server POST to internal addresses (metadata service, localhost, ...).
+    """
+    parsed = urlparse(url)
+    return parsed.scheme in ("http", "https") and (parsed.hostname or "").lower() in WEBHOOK_ALLOWED_HOSTS
+
+
+def send_webhook(url: str, payload: dict) -> bool:
+    """POST the payload as JSON to the callback URL, retrying with a short backoff"""
+    if not webhook_url_allowed(url):
+        print(f"⚠️ Webhook to {url} skipped, host not in WEBHOOK_ALLOWED_HOSTS")
+        return False
+    body = json.dumps(payload, default=str).encode("utf-8")
+    for attempt in range(1, WEBHOOK_RETRIES + 1):
+        try:
+            request = urllib.request.Request(
+                url, data=body, method="POST", headers={"Content-Type": "application/json"}
+            )
+            with urllib.request.urlopen(request, timeout=WEBHOOK_TIMEOUT):
+                return True
+        except Exception as e:
+            print(f"⚠️ Webhook to {url} failed (attempt {attempt}/{WEBHOOK_RETRIES}): {e}")
+            if attempt < WEBHOOK_RETRIES:
+                time.sleep(attempt)
+    return False
+
+
+def notify_report_finished(report):
+    """
+    Called wherever a report reaches Complete/Error (report thread, worker, merge step).
+    Publishes the final event in this process and calls the report's webhook if it has one.
+    The webhook is sent from its own thread so a slow or dead callback URL never stalls
+    the worker loop. It is not a daemon thread: a stopping worker still delivers it.
+    """
+    event = report_event(report)
+    event_bus.publish(report.report_id, event)
+
+    if report.callback_url:
+        threading.Thread(
+            target=send_webhook, args=(report.callback_url, event), name=f"webhook-{report.report_id}"
+        ).start()
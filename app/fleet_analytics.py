@@ -0,0 +1,219 @@
+from datetime import timedelta
+import threading
+from sqlalchemy import text, bindparam, DateTime, func
+
+from app.models import StoreStatus, StoreMetadataState
+from app.store_metadata import refresh_store_metadata
+
+# report windows: name -> (hours back, unit used in the CSV report, hours per unit)
+WINDOWS = {
+    "last_hour": (1, "minutes", 1 / 60),
+    "last_day": (24, "hours", 1),
+    "last_week": (24 * 7, "hours", 1),
+}
+PERCENTILES = (5, 25, 50, 75, 95)
+HISTOGRAM_BUCKETS = 10  # uptime ratio buckets of 10%
+WEEKDAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# summary for the latest cache key, {"key": (watermark, metadata state), "summary": {...}}
+_summary_cache = {}
+_cache_lock = threading.Lock()
+
+# Per store uptime ratio for each window, same rule as UptimeCalculator.calculate_uptime_downtime_simple:
+# active polls / all polls in the window, 0 when the store has no polls in the window.
+# Store list matches generate_report: stores in store_metadata with business hours and a timezone.
+PER_STORE_CTE = """
+    WITH stores AS (
+        SELECT sm.store_id, st.timezone_str
+        FROM store_metadata sm
+        JOIN store_timezone st ON st.store_id = sm.store_id
+        WHERE sm.has_business_hours AND sm.has_timezone
+    ),
+    counts AS (
+        SELECT store_id,
+            SUM(CASE WHEN timestamp_utc >= :last_hour_start THEN 1 ELSE 0 END) AS last_hour_total,
+            SUM(CASE WHEN timestamp_utc >= :last_hour_start AND status = 'active' THEN 1 ELSE 0 END) AS last_hour_active,
+            SUM(CASE WHEN timestamp_utc >= :last_day_start THEN 1 ELSE 0 END) AS last_day_total,
+            SUM(CASE WHEN timestamp_utc >= :last_day_start AND status = 'active' THEN 1 ELSE 0 END) AS last_day_active,
+            COUNT(*) AS last_week_total,
+            SUM(CASE WHEN status = 'active' THEN 1 ELSE 0 END) AS last_week_active
+        FROM store_status
+        WHERE timestamp_utc >= :last_week_start AND timestamp_utc <= :current_time
+        GROUP BY store_id
+    ),
+    per_store AS (
+        SELECT s.store_id, s.timezone_str,
+            CASE WHEN c.last_hour_total > 0 THEN 1.0 * c.last_hour_active / c.last_hour_total ELSE 0 END AS last_hour,
+            CASE WHEN c.last_day_total > 0 THEN 1.0 * c.last_day_active / c.last_day_total ELSE 0 END AS last_day,
+            CASE WHEN c.last_week_total > 0 THEN 1.0 * c.last_week_active / c.last_week_total ELSE 0 END AS last_week
+        FROM stores s
+        LEFT JOIN counts c ON c.store_id = s.store_id
+    )
+"""
+
+
+def _window_params(current_time) -> dict:
+    """Start of every window plus current time, as bind parameters"""
+    params = {"current_time": current_time}
+    for name, (hours_back, _, _) in WINDOWS.items():
+        params[f"{name}_start"] = current_time - timedelta(hours=hours_back)
+    return params
+
+
+def _query(session, sql: str, params: dict):
+    """Run raw SQL with DateTime bind params, so SQLite compares timestamps in the stored format"""
+    stmt = text(sql).bindparams(*[bindparam(name, type_=DateTime) for name in params])
+    return session.execute(stmt, params)
+
+
+def _weekday_expression(session) -> str:
+    """SQL for weekday of timestamp_utc with 0 = Monday (same as business_hours.day_of_week)"""
+    if session.get_bind().dialect.name == "sqlite":
+        return "((CAST(strftime('%w', timestamp_utc) AS INTEGER) + 6) % 7)"
+    return "((CAST(EXTRACT(DOW FROM timestamp_utc) AS INTEGER) + 6) % 7)"
+
+
+def _fleet_stats(session, params: dict) -> dict:
+    """
+    Average, zero-uptime count, percentiles and histogram for every window, in one query.
+    Percentiles use the nearest-rank method on ROW_NUMBER() so they work on SQLite and PostgreSQL.
+    """
+    ranked_columns = [f"{name}, ROW_NUMBER() OVER (ORDER BY {name}) AS {name}_rank" for name in WINDOWS]
+    select_columns = ["COUNT(*) AS total_stores"]
+    for name in WINDOWS:
+        select_columns.append(f"AVG({name}) AS {name}_avg")
+        select_columns.append(f"SUM(CASE WHEN {name} = 0 THEN 1 ELSE 0 END) AS {name}_zero")
+        for p in PERCENTILES:
+            select_columns.append(f"MIN(CASE WHEN {name}_rank * 100 >= {p} * store_count THEN {name} END) AS {name}_p{p}")
+        for bucket in range(HISTOGRAM_BUCKETS):
+            low = bucket / HISTOGRAM_BUCKETS
+            high = (bucket + 1) / HISTOGRAM_BUCKETS
+            # last bucket also takes stores with 100% uptime
+            upper = f"{name} <= {high}" if bucket == HISTOGRAM_BUCKETS - 1 else f"{name} < {high}"
+            select_columns.append(f"SUM(CASE WHEN {name} >= {low} AND {upper} THEN 1 ELSE 0 END) AS {name}_h{bucket}")
+
+    sql = PER_STORE_CTE + f"""
+        , ranked AS (
+            SELECT {", ".join(ranked_columns)}, COUNT(*) OVER () AS store_count
+            FROM per_store
+        )
+        SELECT {", ".join(select_columns)}
+        FROM ranked
+    """
+    row = _query(session, sql, params).mappings().one()
+
+    windows = {}
+    for name, (hours_back, unit, hours_per_unit) in WINDOWS.items():
+        # ratio -> report unit (minutes for last hour, hours otherwise)
+        scale = hours_back / hours_per_unit
+        avg_ratio = row[f"{name}_avg"] or 0
+        windows[name] = {
+            "unit": unit,
+            "avg_uptime": round(avg_ratio * scale, 2),
+            "avg_downtime": round((1 - avg_ratio) * scale, 2) if row["total_stores"] else 0.0,
+            "zero_uptime_stores": row[f"{name}_zero"] or 0,
+            "uptime_percentiles": {
+                f"p{p}": round((row[f"{name}_p{p}"] or 0) * scale, 2) for p in PERCENTILES
+            },
+            "uptime_histogram": [
+                {
+                    "uptime_pct": f"{bucket * 100 // HISTOGRAM_BUCKETS}-{(bucket + 1) * 100 // HISTOGRAM_BUCKETS}",
+                    "stores": row[f"{name}_h{bucket}"] or 0,
+                }
+                for bucket in range(HISTOGRAM_BUCKETS)
+            ],
+        }
+
+    return {"total_stores": row["total_stores"], "windows": windows}
+
+
+def _by_timezone(session, params: dict) -> list:
+    """Store count and average uptime per window for every timezone"""
+    averages = ", ".join(f"AVG({name}) AS {name}" for name in WINDOWS)
+    sql = PER_STORE_CTE + f"""
+        SELECT timezone_str, COUNT(*) AS stores, {averages}
+        FROM per_store
+        GROUP BY timezone_str
+        ORDER BY stores DESC, timezone_str
+    """
+    result = []
+    for row in _query(session, sql, params).mappings():
+        entry = {"timezone": row["timezone_str"], "stores": row["stores"]}
+        for name, (hours_back, unit, hours_per_unit) in WINDOWS.items():
+            entry[f"avg_uptime_{name}(in {unit})"] = round((row[name] or 0) * hours_back / hours_per_unit, 2)
+        result.append(entry)
+    return result
+
+
+def _by_weekday(session, params: dict) -> list:
+    """
+    Poll counts and active share per weekday over the last week.
+    Weekday is taken from the UTC timestamp, converting every poll to local
+    time is not possible in SQLite without hydrating the rows.
+    """
+    weekday = _weekday_expression(session)
+    sql = f"""
+        SELECT {weekday} AS weekday,
+            COUNT(*) AS polls,
+            SUM(CASE WHEN status = 'active' THEN 1 ELSE 0 END) AS active_polls
+        FROM store_status
+        WHERE timestamp_utc >= :last_week_start AND timestamp_utc <= :current_time
+        GROUP BY {weekday}
+        ORDER BY weekday
+    """
+    week_params = {k: params[k] for k in ("last_week_start", "current_time")}
+    return [
+        {
+            "weekday_utc": row["weekday"],
+            "name": WEEKDAY_NAMES[row["weekday"]],
+            "polls": row["polls"],
+            "active_polls": row["active_polls"],
+            "active_ratio": round(row["active_polls"] / row["polls"], 4) if row["polls"] else 0.0,
+        }
+        for row in _query(session, sql, week_params).mappings()
+    ]
+
+
+def compute_fleet_summary(session, current_time) -> dict:
+    """Run all fleet aggregates for the given "current time" (no caching)"""
+    params = _window_params(current_time)
+    summary = {"watermark": current_time}
+    summary.update(_fleet_stats(session, params))
+    summary["by_timezone"] = _by_timezone(session, params)
+    summary["by_weekday"] = _by_weekday(session, params)
+    return summary
+
+
+def _metadata_state(session) -> tuple:
+    """(last_status_id, updated_at) of store_metadata_state, (None, None) if the metadata was never built"""
+    state = session.query(StoreMetadataState.last_status_id, StoreMetadataState.updated_at).filter(
+        StoreMetadataState.id == 1
+    ).first()
+    return tuple(state) if state else (None, None)
+
+
+def get_fleet_summary(session) -> dict:
+    """
+    Fleet level uptime summary, cached per (watermark, latest store_status id, store_metadata state).
+    The watermark is the latest poll time and the latest id catches late polls with older
+    timestamps, both are index lookups. The store list comes from store_metadata, so its
+    state is part of the key too: the cache refreshes itself when polls arrive or the metadata changes.
+    On a cache miss store_metadata is brought up to date first (incrementally) if it lags
+    behind store_status, e.g. it was never built or polls were loaded since the last report.
+    """
+    watermark = session.query(func.max(StoreStatus.timestamp_utc)).scalar()
+    if watermark is None:
+        return {"watermark": None, "total_stores": 0, "windows": {}, "by_timezone": [], "by_weekday": []}
+
+    with _cache_lock:
+        max_status_id = session.query(func.max(StoreStatus.id)).scalar()
+        key = (watermark, max_status_id, *_metadata_state(session))
+        if _summary_cache.get("key") != key:
+            last_status_id = key[2]
+            if last_status_id is None or last_status_id < max_status_id:
+                refresh_store_metadata(session)
+                key = (watermark, max_status_id, *_metadata_state(session))
+            print(f"📊 Computing fleet summary for watermark {watermark}...")
+            _summary_cache["summary"] = compute_fleet_summary(session, watermark)
+            _summary_cache["key"] = key
+        return _summary_cache["summary"]
@@ -0,0 +1,287 @@
+from datetime import datetime, timedelta, timezone
+import uuid
+from sqlalchemy import select, delete, insert, func, tuple_, Table, Column, MetaData
+from sqlalchemy.orm import sessionmaker
+import pytz
+
+from app.database import engine, begin_write, insert_for_dialect
+from app.models import StoreStatus, BusinessHours, StoreTimezone, Incident, IncidentsState
+
+DEFAULT_TIMEZONE = "America/Chicago"  # same default as UptimeCalculator
+BATCH_SIZE = 100000  # polls read from the database at a time
+INCIDENT_COLUMNS = ["store_id", "start_utc", "end_utc", "duration_minutes",
+                    "poll_count", "business_minutes", "is_ongoing"]
+
+
+def load_store_schedules(session):
+    """
+    Load timezone and business hours of every store in two queries.
+    Returns (timezones {store_id: tz}, hours {store_id: {day_of_week: [(start, end), ...]}}).
+    """
+    timezones = dict(session.query(StoreTimezone.store_id, StoreTimezone.timezone_str).all())
+
+    hours = {}
+    for store_id, day, start, end in session.query(
+        BusinessHours.store_id, BusinessHours.day_of_week,
+        BusinessHours.start_time_local, BusinessHours.end_time_local
+    ):
+        hours.setdefault(store_id, {}).setdefault(day, []).append((start, end))
+    return timezones, hours
+
+
+def business_overlap_minutes(start_utc: datetime, end_utc: datetime, tz_name: str, day_hours: dict) -> float:
+    """
+    Minutes of [start_utc, end_utc) that fall inside the store's business hours.
+    Missing business hours mean open 24x7, hours that end before they start run past midnight.
+    """
+    if not day_hours:
+        return (end_utc - start_utc).total_seconds() / 60
+
+    tz = pytz.timezone(tz_name)
+    start_local = pytz.utc.localize(start_utc).astimezone(tz)
+    end_local = pytz.utc.localize(end_utc).astimezone(tz)
+
+    total = timedelta()
+    # start one day early so overnight hours from the previous day are counted
+    day = start_local.date() - timedelta(days=1)
+    while day <= end_local.date():
+        for open_time, close_time in day_hours.get(day.weekday(), []):
+            open_dt = tz.localize(datetime.combine(day, open_time))
+            close_day = day if close_time > open_time else day + timedelta(days=1)
+            close_dt = tz.localize(datetime.combine(close_day, close_time))
+            overlap = min(end_local, close_dt) - max(start_local, open_dt)
+            if overlap > timedelta():
+                total += overlap
+        day += timedelta(days=1)
+
+    return total.total_seconds() / 60
+
+
+def extract_incidents(polls, watermark: datetime):
+    """
+    Run-length encode a batch of polls into inactive intervals.
+
+    polls must be sorted by store_id, timestamp_utc and contain every poll of
+    the stores in it. A new run starts whenever the store or the status changes;
+    runs of inactive polls become incidents that end at the next poll of the store
+    (or at the watermark when the store's latest poll is inactive).
+    Everything is done with vectorized NumPy operations, no per poll Python loop.
+    """
+    import numpy as np
+    import pandas as pd
+
+    store = polls["store_id"].to_numpy()
+    status = polls["status"].to_numpy()
+    ts = pd.to_datetime(polls["timestamp_utc"]).to_numpy()
+
+    # next poll time of the same store (NaT for a store's latest poll)
+    same_store_next = np.append(store[1:] == store[:-1], False)
+    next_ts = np.append(ts[1:], np.datetime64("NaT"))
+    next_ts = np.where(same_store_next, next_ts, np.datetime64("NaT"))
+
+    # a run starts at a new store or a status change, and ends where the next one starts
+    run_start = np.ones(len(store), dtype=bool)
+    run_start[1:] = (store[1:] != store[:-1]) | (status[1:] != status[:-1])
+    run_end = np.append(run_start[1:], True)
+
+    inactive = status == "inactive"
+    start_idx = np.flatnonzero(run_start & inactive)
+    end_idx = np.flatnonzero(run_end & inactive)
+
+    runs = pd.DataFrame({
+        "store_id": store[start_idx],
+        "start_utc": ts[start_idx],
+        "end_utc": next_ts[end_idx],
+        "poll_count": end_idx - start_idx + 1,
+    })
+    runs["is_ongoing"] = runs["end_utc"].isna()
+    runs["end_utc"] = runs["end_utc"].fillna(pd.Timestamp(watermark))
+    runs["duration_minutes"] = (runs["end_utc"] - runs["start_utc"]).dt.total_seconds() / 60
+    return runs
+
+
+def read_poll_batches(session, watermark: datetime, batch_size: int = BATCH_SIZE):
+    """
+    Yield polls up to the watermark ordered by store and time, batch_size rows at a time.
+    Keyset pagination on (store_id, timestamp_utc, id) walks the store/time index,
+    and every batch is its own short read transaction, so writers are not blocked
+    for the whole scan.
+    """
+    import pandas as pd
+
+    key_columns = (StoreStatus.store_id, StoreStatus.timestamp_utc, StoreStatus.id)
+    key = None
+    while True:
+        query = (
+            select(*key_columns, StoreStatus.status)
+            .where(StoreStatus.timestamp_utc <= watermark)
+            .order_by(*key_columns)
+            .limit(batch_size)
+        )
+        if key is not None:
+            query = query.where(tuple_(*key_columns) > tuple_(*key))
+        rows = session.execute(query).fetchall()
+        session.commit()
+        if not rows:
+            return
+
+        key = tuple(rows[-1][:3])
+        yield pd.DataFrame.from_records(rows, columns=["store_id", "timestamp_utc", "id", "status"])
+        if len(rows) < batch_size:
+            return
+
+
+def complete_store_batches(batches):
+    """
+    Re-cut poll batches so that a store never spans two batches:
+    the last store of every batch is held back and put in front of the next one.
+    """
+    import pandas as pd
+
+    pending = None
+    for batch in batches:
+        if pending is not None:
+            batch = pd.concat([pending, batch], ignore_index=True)
+
+        # last store may continue in the next batch
+        is_last = batch["store_id"] == batch["store_id"].iloc[-1]
+        pending = batch[is_last]
+        batch = batch[~is_last].reset_index(drop=True)
+        if not batch.empty:
+            yield batch
+
+    if pending is not None:
+        yield pending.reset_index(drop=True)
+
+
+def incident_records(incidents, timezones: dict, hours: dict) -> list:
+    """Rows for the incidents table, with the business hours overlap of every incident"""
+    records = []
+    for row in incidents.itertuples(index=False):
+        start_utc = row.start_utc.to_pydatetime()
+        end_utc = row.end_utc.to_pydatetime()
+        records.append({
+            "store_id": row.store_id,
+            "start_utc": start_utc,
+            "end_utc": end_utc,
+            "duration_minutes": round(row.duration_minutes, 2),
+            "poll_count": int(row.poll_count),
+            "business_minutes": round(business_overlap_minutes(
+                start_utc, end_utc,
+                timezones.get(row.store_id, DEFAULT_TIMEZONE),
+                hours.get(row.store_id)
+            ), 2),
+            "is_ongoing": bool(row.is_ongoing),
+        })
+    return records
+
+
+def rebuild_incidents() -> dict:
+    """
+    Rebuild the incidents table from store_status.
+
+    Steps followed:
+    1. Read polls ordered by store and time in batches (bounded memory, short read transactions).
+    2. Keep the last store of each batch for the next one, so runs never get cut in half.
+    3. Run-length encode every batch into incidents, add business hours overlap and
+       write them to a staging table, committing per batch.
+    4. Swap the staging rows into the incidents table in one short write transaction
+       and record the watermark the incidents were built at.
+    """
+    print("🔄 Rebuilding downtime incidents...")
+    start_time = datetime.now()
+
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    # private staging table of this run, same columns as incidents
+    staging = Table(
+        f"incidents_staging_{uuid.uuid4().hex[:8]}", MetaData(),
+        *[Column(name, Incident.__table__.c[name].type) for name in INCIDENT_COLUMNS]
+    )
+
+    try:
+        watermark = session.query(func.max(StoreStatus.timestamp_utc)).scalar()
+        timezones, hours = load_store_schedules(session)
+        session.commit()
+        staging.create(bind=engine)
+
+        total = 0
+        ongoing = 0
+        batches = read_poll_batches(session, watermark, BATCH_SIZE) if watermark is not None else []
+        for batch in complete_store_batches(batches):
+            records = incident_records(extract_incidents(batch, watermark), timezones, hours)
+            if records:
+                session.execute(insert(staging), records)
+                session.commit()
+            total += len(records)
+            ongoing += sum(r["is_ongoing"] for r in records)
+            print(f"Extracted {total} incidents...")
+
+        begin_write(session)
+        session.execute(delete(Incident))
+        session.execute(insert(Incident).from_select(
+            INCIDENT_COLUMNS, select(*[staging.c[name] for name in INCIDENT_COLUMNS])
+        ))
+        stmt = insert_for_dialect(IncidentsState.__table__).values(
+            id=1, watermark=watermark, rebuilt_at=datetime.now(timezone.utc)
+        )
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={"watermark": stmt.excluded.watermark, "rebuilt_at": stmt.excluded.rebuilt_at},
+        ))
+        session.commit()
+
+        print(f"✅ Incidents rebuilt: {total} incidents, {ongoing} ongoing")
+        print(f"📊 Incident extraction finished in {(datetime.now() - start_time)} sec")
+        return {"watermark": watermark, "incidents": total, "ongoing": ongoing}
+
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Error rebuilding incidents: {e}")
+        raise
+
+    finally:
+        session.close()
+        staging.drop(bind=engine, checkfirst=True)
+
+
+def get_incidents_watermark(session):
+    """Latest poll time the incidents table was built at, None if it was never built"""
+    return session.query(IncidentsState.watermark).filter(IncidentsState.id == 1).scalar()
+
+
+def query_incidents(session, order: str = "longest", limit: int = 10,
+                    store_id: str = None, business_hours_only: bool = False) -> list:
+    """
+    Top-N incidents from the incidents table (never touches store_status).
+    order = "longest": longest incidents first (uses the duration index)
+    order = "ongoing": only ongoing incidents, the ones that started earliest first
+    """
+    query = session.query(Incident)
+    if store_id:
+        query = query.filter(Incident.store_id == store_id)
+    if business_hours_only:
+        query = query.filter(Incident.business_minutes > 0)
+
+    if order == "ongoing":
+        query = query.filter(Incident.is_ongoing.is_(True)).order_by(Incident.start_utc)
+    else:
+        query = query.order_by(Incident.duration_minutes.desc())
+
+    return [
+        {
+            "store_id": incident.store_id,
+            "start_utc": incident.start_utc,
+            "end_utc": incident.end_utc,
+            "duration_minutes": incident.duration_minutes,
+            "business_minutes": incident.business_minutes,
+            "poll_count": incident.poll_count,
+            "is_ongoing": incident.is_ongoing,
+        }
+        for incident in query.limit(limit).all()
+    ]
+
+
+if __name__ == "__main__":
+    rebuild_incidents()
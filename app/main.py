@@ -1,22 +1,39 @@
 from fastapi import FastAPI, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
 from contextlib import asynccontextmanager
+from typing import Optional
+import asyncio
+import json
 import uuid
 import os
 import threading
 
-from app.database import get_db, create_tables
+from app.config import REPORT_EXECUTION, REPORT_LONG_POLL_MAX, SSE_KEEPALIVE_SECONDS
+from app.database import get_db, ensure_schema
+from app.events import (
+    FINISHED_STATUSES,
+    event_bus,
+    load_report_events,
+    wait_for_report_finish,
+    watch_report_status,
+    webhook_url_allowed,
+)
 from app.models import ReportStatus
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Initialize db tables when app starts
-    create_tables()
+    # Initialize db tables when app starts (skipped if the schema version already matches)
+    ensure_schema()
     print("✅ Database tables ready!")
+    # publishes status changes of reports that have SSE / long poll subscribers
+    watcher = asyncio.create_task(watch_report_status())
     yield
     # On shutdown 
     print("🔄 Shutting down...")
+    watcher.cancel()
 
 # FastAPI app config with lifespan hooks
 app = FastAPI(
@@ -36,38 +53,56 @@ async def root():
     }
 
 @app.post("/trigger_report")
-async def trigger_report(db: Session = Depends(get_db)):
+async def trigger_report(callback_url: Optional[str] = None, db: Session = Depends(get_db)):
     """
     Start report generation in background
+    By default the job is only queued, a `python -m app.worker` process picks it up.
+    callback_url: optional http(s) URL (host in WEBHOOK_ALLOWED_HOSTS) that gets a JSON POST
+    when the report is Complete/Error
     Returns: report_id 
     """
+    if callback_url and not webhook_url_allowed(callback_url):
+        raise HTTPException(status_code=400, detail="callback_url must be an http(s) URL on an allowed host (WEBHOOK_ALLOWED_HOSTS)")
+
     try:
         report_id = str(uuid.uuid4())    # Generate unique ID 
+        run_in_thread = REPORT_EXECUTION == "thread"
+        status = "Running" if run_in_thread else "Queued"
   
         # Insert initial report status in DB
         report_status = ReportStatus(
             report_id=report_id,
-            status="Running",
-            created_at=datetime.now(timezone.utc)
+            status=status,
+            created_at=datetime.now(timezone.utc),
+            started_at=datetime.now(timezone.utc) if run_in_thread else None,
+            # the report thread keeps the heartbeat fresh, like a worker would
+            heartbeat_at=datetime.now(timezone.utc) if run_in_thread else None,
+            attempts=1 if run_in_thread else None,
+            callback_url=callback_url
         )
         db.add(report_status)
         db.commit()
         
-        # Import here to avoid circular dependency
-        from app.background_tasks import generate_report_async
-        
-        # Run report generation in a background thread
-        thread = threading.Thread(target=generate_report_async, args=(report_id,))
-        thread.daemon = True
-        thread.start()
-        
-        print(f"📊 Report {report_id} generation started in background...")
+        if run_in_thread:
+            # Import here to avoid circular dependency
+            from app.background_tasks import generate_report_async
+            
+            # Run report generation in a background thread
+            thread = threading.Thread(target=generate_report_async, args=(report_id,))
+            thread.daemon = True
+            thread.start()
+            
+            print(f"📊 Report {report_id} generation started in background...")
+            message = "Report generation started"
+        else:
+            print(f"📊 Report {report_id} queued for a worker...")
+            message = "Report generation queued"
         
         # Return immediately without waiting for the report
         return {
             "report_id": report_id,
-            "status": "Running",
-            "message": "Report generation started"
+            "status": status,
+            "message": message
         }
         
     except Exception as e:
@@ -76,21 +111,43 @@ async def trigger_report(db: Session = Depends(get_db)):
 
 
 @app.get("/get_report")
-async def get_report(report_id: str, db: Session = Depends(get_db)):
+async def get_report(report_id: str, wait: float = 0, db: Session = Depends(get_db)):
     """
     Get report status or download it if completed
+    wait: long polling, seconds to wait for the report to finish before answering
+    (at most REPORT_LONG_POLL_MAX)
     """
+    if not 0 <= wait <= REPORT_LONG_POLL_MAX:
+        raise HTTPException(status_code=400, detail=f"wait must be between 0 and {REPORT_LONG_POLL_MAX:g} seconds")
+
+    # subscribe before reading the status, so a completion in between is not missed
+    queue = event_bus.subscribe(report_id) if wait else None
     try:
         report = db.query(ReportStatus).filter(ReportStatus.report_id == report_id).first()
+
+        if report and queue and report.status not in FINISHED_STATUSES:
+            # don't hold a DB connection while waiting, the session reconnects for the re-read
+            db.close()
+            await wait_for_report_finish(queue, wait)
+            report = db.query(ReportStatus).filter(ReportStatus.report_id == report_id).first()
         
         if not report:
             raise HTTPException(status_code=404, detail="Report not found")
         
-        if report.status == "Running":
+        if report.status == "Queued":
+            return {
+                "report_id": report_id,
+                "status": "Queued",
+                "message": "Report is queued, waiting for a worker..."
+            }
+        
+        if report.status in ("Running", "Merging"):
             return {
                 "report_id": report_id,
                 "status": "Running",
-                "message": "Report generation in progress..."
+                "message": "Report generation in progress...",
+                "stores_processed": report.stores_processed,
+                "stores_total": report.stores_total
             }
         
         elif report.status == "Complete":
@@ -121,6 +178,131 @@ async def get_report(report_id: str, db: Session = Depends(get_db)):
     except Exception as e:
         print(f"Error getting report: {e}")
         raise HTTPException(status_code=500, detail="Failed to get report status")
+    finally:
+        if queue:
+            event_bus.unsubscribe(report_id, queue)
+
+
+def _sse_message(event: dict) -> str:
+    """Format a report event as a server-sent event"""
+    return f"event: report\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+@app.get("/reports/{report_id}/events")
+async def report_events(report_id: str):
+    """
+    Server-sent events stream of a report's progress.
+    Sends the current status right away, then every change (stores processed,
+    status) until the report is Complete or Error, then closes the stream.
+    Events come from the in-process event bus, no DB session is held while streaming.
+    """
+    # subscribe before reading the status, so a change in between is not missed
+    queue = event_bus.subscribe(report_id)
+    try:
+        events = await run_in_threadpool(load_report_events, [report_id])
+    except Exception as e:
+        event_bus.unsubscribe(report_id, queue)
+        print(f"Error getting report events: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get report status")
+
+    if not events:
+        event_bus.unsubscribe(report_id, queue)
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    async def stream():
+        try:
+            event = events[0]
+            yield _sse_message(event)
+            while event["status"] not in FINISHED_STATUSES:
+                try:
+                    next_event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # comment line keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                if next_event != event:
+                    event = next_event
+                    yield _sse_message(event)
+        finally:
+            event_bus.unsubscribe(report_id, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/fleet/summary")
+def fleet_summary(db: Session = Depends(get_db)):
+    """
+    Fleet level uptime analytics: averages, percentiles and histograms per window,
+    grouped by timezone and by weekday. Computed with SQL aggregates and cached
+    until new polls arrive or the store metadata changes.
+    """
+    try:
+        from app.fleet_analytics import get_fleet_summary
+        return get_fleet_summary(db)
+
+    except Exception as e:
+        print(f"Error computing fleet summary: {e}")
+        raise HTTPException(status_code=500, detail="Failed to compute fleet summary")
+
+
+@app.get("/incidents")
+def get_incidents(order: str = "longest", limit: int = 10, store_id: str = None,
+                  business_hours_only: bool = False, db: Session = Depends(get_db)):
+    """
+    Top-N downtime incidents across the fleet (or for one store).
+    order: "longest" (longest incidents first) or "ongoing" (still inactive, oldest first)
+    """
+    if order not in ("longest", "ongoing"):
+        raise HTTPException(status_code=400, detail="order must be 'longest' or 'ongoing'")
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+
+    try:
+        from app.incidents import query_incidents, get_incidents_watermark
+        return {
+            "order": order,
+            # ongoing incidents are as of this poll time, POST /incidents/rebuild refreshes them
+            "watermark": get_incidents_watermark(db),
+            "incidents": query_incidents(db, order, limit, store_id, business_hours_only)
+        }
+
+    except Exception as e:
+        print(f"Error getting incidents: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get incidents")
+
+
+@app.post("/incidents/rebuild")
+def trigger_incident_rebuild():
+    """
+    Re-extract downtime incidents from store_status into the incidents table.
+    Plain def so FastAPI runs it in its threadpool instead of blocking the event loop.
+    """
+    try:
+        from app.incidents import rebuild_incidents
+        return {"status": "Complete", **rebuild_incidents()}
+
+    except Exception as e:
+        print(f"Error rebuilding incidents: {e}")
+        raise HTTPException(status_code=500, detail="Failed to rebuild incidents")
+
+
+@app.post("/maintenance/retention")
+def trigger_retention():
+    """
+    Roll store_status polls older than the retention horizon into hourly
+    aggregates, archive/delete the raw rows and vacuum the database.
+    Plain def so FastAPI runs it in its threadpool instead of blocking the event loop.
+    Never runs the one time full VACUUM of an old SQLite file, it would lock the
+    database for API and workers for the whole rewrite: run `python -m app.retention` once for that.
+    """
+    try:
+        from app.retention import run_retention
+        result = run_retention(allow_full_vacuum=False)
+        return {"status": "Complete", **result}
+
+    except Exception as e:
+        print(f"Error running retention job: {e}")
+        raise HTTPException(status_code=500, detail="Failed to run retention job")
 
 
 @app.get("/health")
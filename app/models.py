@@ -1,15 +1,23 @@
-from sqlalchemy import Column, String, DateTime, Integer, Time
+from sqlalchemy import Column, String, Text, DateTime, Date, Integer, BigInteger, Time, Float, Boolean, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 
 # Base class for all the models
 Base = declarative_base()
 
+# Bump this whenever a table, column or index is added below,
+# so that startup knows it has to create/upgrade the schema
+SCHEMA_VERSION = 11
+
 class StoreStatus(Base):
     """
     Table to store the status of each store at a given timestamp.
     status = 'active' or 'inactive'
     """
     __tablename__ = "store_status"
+    __table_args__ = (
+        # per store time ordered scans (incident extraction, per store window queries)
+        Index("ix_store_status_store_ts", "store_id", "timestamp_utc"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)  # unique id for each row
     store_id = Column(String, nullable=False, index=True)  # store identifier
@@ -31,6 +39,23 @@ class BusinessHours(Base):
     end_time_local = Column(Time, nullable=False)  # closing time (local time)
 
 
+class StoreStatusHourly(Base):
+    """
+    Table to store hourly rollups of old store status polls.
+    Raw polls older than the retention horizon are compacted into one row per store per hour.
+    """
+    __tablename__ = "store_status_hourly"
+    __table_args__ = (
+        UniqueConstraint("store_id", "hour_utc", name="uq_store_status_hourly_store_hour"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)  # unique id for each row
+    store_id = Column(String, nullable=False, index=True)  # store identifier
+    hour_utc = Column(DateTime, nullable=False, index=True)  # start of the hour in UTC
+    active_count = Column(Integer, nullable=False, default=0)  # number of active polls in the hour
+    inactive_count = Column(Integer, nullable=False, default=0)  # number of inactive polls in the hour
+
+
 class StoreTimezone(Base):
     """
     Table to store timezone info of each store.
@@ -43,6 +68,55 @@ class StoreTimezone(Base):
     timezone_str = Column(String, nullable=False)  # timezone string (eg -> "America/Chicago")
 
 
+class StoreMetadata(Base):
+    """
+    Table to store per store summary of the poll data.
+    Lets the report enumerate stores and skip stores without polls in a window
+    without touching store_status. Maintained by app.store_metadata.
+    """
+    __tablename__ = "store_metadata"
+    __table_args__ = (
+        # stores the report can process, in store order
+        Index("ix_store_metadata_reportable", "has_business_hours", "has_timezone", "store_id"),
+    )
+
+    store_id = Column(String, primary_key=True)  # store identifier
+    first_poll_utc = Column(DateTime, nullable=False)  # oldest poll in store_status
+    last_poll_utc = Column(DateTime, nullable=False, index=True)  # latest poll in store_status
+    poll_count = Column(Integer, nullable=False)  # number of polls in store_status
+    has_business_hours = Column(Boolean, nullable=False)  # store has rows in business_hours
+    has_timezone = Column(Boolean, nullable=False)  # store has a row in store_timezone
+    updated_at = Column(DateTime, nullable=False)  # when this row was last refreshed
+
+
+class StoreDailyPolls(Base):
+    """
+    Table to store number of polls per store per UTC day.
+    A window whose days all have zero polls can be answered without a query.
+    """
+    __tablename__ = "store_daily_polls"
+    __table_args__ = (
+        UniqueConstraint("store_id", "day_utc", name="uq_store_daily_polls_store_day"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)  # unique id for each row
+    store_id = Column(String, nullable=False)  # store identifier
+    day_utc = Column(Date, nullable=False, index=True)  # UTC date
+    poll_count = Column(Integer, nullable=False)  # number of polls on that day
+
+
+class StoreMetadataState(Base):
+    """
+    One row table with the store_status id up to which store_metadata and
+    store_daily_polls are aggregated (high-water mark of the incremental refresh).
+    """
+    __tablename__ = "store_metadata_state"
+
+    id = Column(Integer, primary_key=True)  # always 1
+    last_status_id = Column(Integer, nullable=False)  # highest store_status.id already counted
+    updated_at = Column(DateTime, nullable=False)  # when the metadata was last refreshed
+
+
 class ReportStatus(Base):
     """
     Table to track report generation jobs.
@@ -51,7 +125,86 @@ class ReportStatus(Base):
     __tablename__ = "report_status"
     
     report_id = Column(String, primary_key=True)  # unique report identifier (UUID)
-    status = Column(String, nullable=False)  # Running / Complete / Error
-    created_at = Column(DateTime, nullable=False)  # when report job started
+    status = Column(String, nullable=False, index=True)  # Queued / Running / Merging / Complete / Error
+    created_at = Column(DateTime, nullable=False)  # when report job was requested
+    started_at = Column(DateTime, nullable=True)  # when a worker claimed the job
     completed_at = Column(DateTime, nullable=True)  # when report finished
+    worker_id = Column(String, nullable=True)  # worker that claimed the job
+    attempts = Column(Integer, nullable=True)  # how many times the job was claimed, identifies the current claim
+    heartbeat_at = Column(DateTime, nullable=True)  # last sign of life of the worker/thread running the job
     file_path = Column(String, nullable=True)  # path to generated report file
+    num_shards = Column(Integer, nullable=True)  # set when the report was split into shards
+    stores_total = Column(Integer, nullable=True)  # number of stores in the report
+    stores_processed = Column(Integer, nullable=True)  # progress, stores done so far
+    callback_url = Column(String, nullable=True)  # webhook called when the report finishes
+
+
+class ReportShard(Base):
+    """
+    Table to track shards of a distributed report.
+    Each shard covers a range of store_id hashes and is processed by one worker,
+    its partial CSV is merged into the final report when all shards are Complete.
+    """
+    __tablename__ = "report_shards"
+    __table_args__ = (
+        UniqueConstraint("report_id", "shard_index", name="uq_report_shards_report_shard"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)  # unique id for each row
+    report_id = Column(String, nullable=False, index=True)  # report this shard belongs to
+    shard_index = Column(Integer, nullable=False)  # 0 .. num_shards - 1, also the merge order
+    hash_start = Column(BigInteger, nullable=False)  # first store_id hash in the shard (inclusive)
+    hash_end = Column(BigInteger, nullable=False)  # last store_id hash in the shard (exclusive)
+    current_time_utc = Column(DateTime, nullable=False)  # "current time" shared by all shards
+    store_ids = Column(Text, nullable=False)  # newline separated stores of the shard, fixed by the coordinator
+    status = Column(String, nullable=False, index=True)  # Queued / Running / Complete / Error
+    attempts = Column(Integer, nullable=False, default=0)  # how many times it was claimed
+    worker_id = Column(String, nullable=True)  # worker that claimed it last
+    claimed_at = Column(DateTime, nullable=True)  # when it was claimed last
+    completed_at = Column(DateTime, nullable=True)  # when it finished
+    file_path = Column(String, nullable=True)  # partial CSV
+    error = Column(String, nullable=True)  # last error message
+
+
+class Incident(Base):
+    """
+    Table to store downtime incidents.
+    Each row is one contiguous run of inactive polls for a store, from the first
+    inactive poll until the next active poll (or the latest poll time if still ongoing).
+    """
+    __tablename__ = "incidents"
+    __table_args__ = (
+        Index("ix_incidents_store_start", "store_id", "start_utc"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)  # unique id for each row
+    store_id = Column(String, nullable=False)  # store identifier
+    start_utc = Column(DateTime, nullable=False, index=True)  # first inactive poll
+    end_utc = Column(DateTime, nullable=False)  # next active poll, or latest poll time if ongoing
+    duration_minutes = Column(Float, nullable=False, index=True)  # end_utc - start_utc
+    poll_count = Column(Integer, nullable=False)  # number of inactive polls in the run
+    business_minutes = Column(Float, nullable=False)  # part of the incident inside business hours
+    is_ongoing = Column(Boolean, nullable=False, index=True)  # store's latest poll is still inactive
+
+
+class IncidentsState(Base):
+    """
+    One row table with the latest poll time the incidents table was built at.
+    Incidents marked ongoing are only current as of this watermark.
+    """
+    __tablename__ = "incidents_state"
+
+    id = Column(Integer, primary_key=True)  # always 1
+    watermark = Column(DateTime, nullable=True)  # latest poll when the incidents were rebuilt
+    rebuilt_at = Column(DateTime, nullable=False)  # when the rebuild finished
+
+
+class SchemaVersion(Base):
+    """
+    Table to remember which schema version the database was last upgraded to.
+    Lets startup skip table creation when nothing has changed.
+    """
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)  # value of SCHEMA_VERSION
+    applied_at = Column(DateTime, nullable=False)  # when this version was applied
@@ -1,19 +1,102 @@
 import pandas as pd
 from datetime import datetime, timezone
 import os
+import uuid
 import math
 from sqlalchemy.orm import sessionmaker
 
 from app.database import engine
 from app.uptime_calculator import UptimeCalculator
+from app.store_metadata import refresh_store_metadata, get_report_store_ids
 
 
-def generate_report():
+# columns of the CSV report, in order
+REPORT_COLUMNS = [
+    'store_id',
+    'uptime_last_hour(in minutes)',
+    'uptime_last_day(in hours)',
+    'uptime_last_week(in hours)',
+    'downtime_last_hour(in minutes)',
+    'downtime_last_day(in hours)',
+    'downtime_last_week(in hours)',
+]
+
+
+def calculate_store_reports(store_ids: list, current_time: datetime = None, progress_callback=None) -> list:
+    """
+    Calculate uptime/downtime rows for the given stores using UptimeCalculator.
+    Stores are processed in batches of 50 so progress can be printed.
+    current_time defaults to the latest poll in the database.
+    progress_callback(stores_processed, stores_total) is called after every batch.
+    """
+    # create calculator object, metadata lets it skip stores without polls in a window
+    calculator = UptimeCalculator(current_time)
+    calculator.load_store_metadata()
+    report_data = []
+
+    batch_size = 50
+    num_batch = math.ceil(len(store_ids) / batch_size)
+
+    # loop through the stores in batches of 50
+    for i in range(0, len(store_ids), batch_size):
+        batch = store_ids[i:i + batch_size]
+        print(f"🔄 Processing Batch {i // batch_size + 1}: {num_batch}")
+
+        # calculate report for each store in this batch
+        for store_id in batch:
+            store_report = calculator.generate_report_for_store(store_id)
+            report_data.append(store_report)
+
+        print(f"✅ Processed {min(i + batch_size, len(store_ids))}/{len(store_ids)} stores")
+        if progress_callback:
+            progress_callback(min(i + batch_size, len(store_ids)), len(store_ids))
+
+    return report_data
+
+
+def generate_partial_report(store_ids: list, path: str, current_time: datetime = None) -> str:
+    """
+    Calculate the report rows for a subset of stores (one shard) and save them as CSV.
+    Written to a temp file first and renamed, so a retried shard never leaves half a file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df = pd.DataFrame(calculate_store_reports(store_ids, current_time), columns=REPORT_COLUMNS)
+
+    # unique temp name: a stale shard may be written by two workers (on any node) at once
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def merge_report_parts(part_paths: list, filename: str) -> str:
+    """
+    Concatenate partial report CSVs into the final report.
+    Files are streamed line by line (header kept from the first part only),
+    so the merge never loads the whole report in memory.
+    """
+    tmp_path = f"{filename}.tmp"
+    with open(tmp_path, 'w', newline='') as out:
+        for n, part_path in enumerate(part_paths):
+            with open(part_path, newline='') as part:
+                header = part.readline()
+                if n == 0:
+                    out.write(header)
+                for line in part:
+                    out.write(line)
+    os.replace(tmp_path, filename)
+    return filename
+
+
+def generate_report(report_id: str = None, progress_callback=None):
     """
     Function to generate uptime and downtime report for stores.
+    If report_id is given it is used in the file name, so that several
+    workers finishing in the same second don't overwrite each other.
+    progress_callback is passed on to calculate_store_reports.
 
     Steps followed:
-    1. Get store ids from database.
+    1. Get store ids from the store_metadata table (refreshed first).
     2. For each store, calculate uptime and downtime using UptimeCalculator.
     3. Store the result in a dataframe.
     4. Save the result as CSV in reports folder.
@@ -29,45 +112,25 @@ def generate_report():
     session = Session()
 
     try:
-        # get distinct store ids from status, business_hours and timezone tables
-        stores_query = session.execute("""
-            SELECT DISTINCT ss.store_id 
-            FROM store_status ss
-            JOIN business_hours bh ON ss.store_id = bh.store_id
-            JOIN store_timezone st ON ss.store_id = st.store_id
-            ORDER BY ss.store_id
-        """).fetchall()
-
-        # extract only the ids
-        store_ids = [row[0] for row in stores_query]
+        # make sure the per store metadata covers the latest polls,
+        # then enumerate stores from it instead of scanning store_status
+        refresh_store_metadata(session)
+        store_ids = get_report_store_ids(session)
         print(f"📋 Found {len(store_ids)} stores to process")
 
-        # create calculator object
-        calculator = UptimeCalculator()
-        report_data = []
-
-        batch_size = 50
-        num_batch = math.ceil(len(store_ids) / batch_size)
-
-        # loop through the stores in batches of 50
-        for i in range(0, len(store_ids), batch_size):
-            batch = store_ids[i:i + batch_size]
-            print(f"🔄 Processing Batch {i // batch_size + 1}: {num_batch}")
-
-            # calculate report for each store in this batch
-            for store_id in batch:
-                store_report = calculator.generate_report_for_store(store_id)
-                report_data.append(store_report)
-
-            print(f"✅ Processed {min(i + batch_size, len(store_ids))}/{len(store_ids)} stores")
-
+        if progress_callback:
+            progress_callback(0, len(store_ids))
+        report_data = calculate_store_reports(store_ids, progress_callback=progress_callback)
 
         # convert list of reports to dataframe
-        df = pd.DataFrame(report_data)
-
-        # add timestamp in filename so that each report is unique
-        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-        filename = f"reports/store_report_{timestamp}.csv"
+        df = pd.DataFrame(report_data, columns=REPORT_COLUMNS)
+
+        # add report id (or timestamp) in filename so that each report is unique
+        if report_id:
+            filename = f"reports/store_report_{report_id}.csv"
+        else:
+            timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+            filename = f"reports/store_report_{timestamp}.csv"
 
         # save dataframe to csv
         df.to_csv(filename, index=False)
@@ -0,0 +1,256 @@
+from datetime import datetime, timedelta
+import os
+from sqlalchemy import select, delete, func, case, text
+from sqlalchemy.orm import sessionmaker
+
+from app.config import (
+    RETENTION_HOURS,
+    ARCHIVE_ENABLED,
+    ARCHIVE_DIR,
+    RETENTION_BATCH_SIZE,
+    VACUUM_PAGES,
+)
+from app.database import engine, insert_for_dialect, begin_write
+from app.models import StoreStatus, StoreStatusHourly
+from app.store_metadata import refresh_store_metadata
+
+# reports look back one week from the latest poll, so raw data must cover at least that
+MIN_RETENTION_HOURS = 24 * 7
+
+
+def get_retention_cutoff(session, retention_hours: int = RETENTION_HOURS):
+    """
+    Get the time before which raw polls can be rolled up.
+    Measured from the latest poll (same "current time" as the reports) and
+    floored to the hour so that an hour is never split between two runs.
+    """
+    current_time = session.query(func.max(StoreStatus.timestamp_utc)).scalar()
+    if current_time is None:
+        return None
+    cutoff = current_time - timedelta(hours=retention_hours)
+    return cutoff.replace(minute=0, second=0, microsecond=0)
+
+
+def _hour_bucket(column):
+    """SQL expression that truncates a timestamp column to the start of its hour"""
+    if engine.dialect.name == "sqlite":
+        # same text format SQLAlchemy uses for DateTime columns in SQLite
+        return func.strftime("%Y-%m-%d %H:00:00.000000", column)
+    return func.date_trunc("hour", column)
+
+
+def archive_raw_polls(session, cutoff: datetime) -> list:
+    """
+    Write raw polls older than the cutoff to compressed files under ARCHIVE_DIR.
+    Uses Parquet when pyarrow is installed, gzipped CSV otherwise.
+    Rows are streamed in batches so the whole table is never held in memory.
+    Files are written with a .tmp suffix and only get their final name from
+    publish_archive() once the polls are really deleted.
+    Returns the final paths.
+    """
+    # pandas is only needed when the archive actually gets written
+    import pandas as pd
+
+    try:
+        import pyarrow  # noqa: F401
+        file_ext = "parquet"
+    except ImportError:
+        file_ext = "csv.gz"
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    stamp = cutoff.strftime("%Y%m%dT%H%M%S")
+
+    result = session.execute(
+        select(StoreStatus.store_id, StoreStatus.status, StoreStatus.timestamp_utc)
+        .where(StoreStatus.timestamp_utc < cutoff)
+        .order_by(StoreStatus.timestamp_utc)
+        .execution_options(stream_results=True)
+    )
+
+    files = []
+    try:
+        while True:
+            rows = result.fetchmany(RETENTION_BATCH_SIZE)
+            if not rows:
+                break
+            df = pd.DataFrame.from_records(rows, columns=["store_id", "status", "timestamp_utc"])
+            path = os.path.join(ARCHIVE_DIR, f"store_status_before_{stamp}_part{len(files) + 1:04d}.{file_ext}")
+            files.append(path)
+            if file_ext == "parquet":
+                df.to_parquet(f"{path}.tmp", index=False)
+            else:
+                df.to_csv(f"{path}.tmp", index=False, compression="gzip")
+            print(f"🗄️ Archived {len(df)} polls -> {path}")
+    except Exception:
+        discard_archive(files)
+        raise
+
+    return files
+
+
+def publish_archive(files: list):
+    """Give archive files their final name, after the rollup/delete transaction committed"""
+    for path in files:
+        os.replace(f"{path}.tmp", path)
+
+
+def discard_archive(files: list):
+    """Remove archive files of a run whose rollup/delete failed, the polls are still in the database"""
+    for path in files:
+        if os.path.exists(f"{path}.tmp"):
+            os.remove(f"{path}.tmp")
+
+
+def rollup_raw_polls(session, cutoff: datetime) -> int:
+    """
+    Add hourly active/inactive counts for polls older than the cutoff into store_status_hourly.
+    Runs as one INSERT ... SELECT in the database, counts are added to any existing row for the same hour.
+    Returns number of raw polls that were rolled up.
+    """
+    hour = _hour_bucket(StoreStatus.timestamp_utc)
+    rollup_select = (
+        select(
+            StoreStatus.store_id,
+            hour,
+            func.sum(case((StoreStatus.status == "active", 1), else_=0)),
+            func.sum(case((StoreStatus.status == "active", 0), else_=1)),
+        )
+        .where(StoreStatus.timestamp_utc < cutoff)
+        .group_by(StoreStatus.store_id, hour)
+    )
+
+    table = StoreStatusHourly.__table__
+    stmt = insert_for_dialect(table).from_select(
+        ["store_id", "hour_utc", "active_count", "inactive_count"], rollup_select
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["store_id", "hour_utc"],
+        set_={
+            "active_count": table.c.active_count + stmt.excluded.active_count,
+            "inactive_count": table.c.inactive_count + stmt.excluded.inactive_count,
+        },
+    )
+
+    rolled_up = session.query(func.count(StoreStatus.id)).filter(StoreStatus.timestamp_utc < cutoff).scalar()
+    session.execute(stmt)
+    return rolled_up
+
+
+def vacuum_database(allow_full_vacuum: bool = True) -> str:
+    """
+    Give the space freed by deleted polls back to the OS.
+    SQLite: incremental vacuum. A database created before incremental mode was enabled needs
+    one full VACUUM to switch modes, which rewrites the whole file under an exclusive lock
+    (API and workers wait for it). With allow_full_vacuum=False that conversion is skipped,
+    the freed pages stay in the file and are reused by new polls.
+    PostgreSQL: plain VACUUM ANALYZE on store_status.
+    Returns "incremental", "full", "skipped" or "analyze".
+    """
+    # VACUUM cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name != "sqlite":
+            conn.exec_driver_sql("VACUUM ANALYZE store_status")
+            return "analyze"
+
+        mode = "incremental"
+        auto_vacuum = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        if auto_vacuum != 2:
+            if not allow_full_vacuum:
+                print("⚠️ SQLite database is not in incremental auto vacuum mode, run `python -m app.retention` "
+                      "once (full VACUUM, locks the database while it runs) to switch it")
+                return "skipped"
+            # database was created before incremental mode was enabled, one full VACUUM converts it
+            print("🧹 Switching SQLite database to incremental auto vacuum (one time full VACUUM)...")
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+            mode = "full"
+        pages = f"({VACUUM_PAGES})" if VACUUM_PAGES > 0 else ""
+        conn.exec_driver_sql(f"PRAGMA incremental_vacuum{pages}")
+        return mode
+
+
+def lock_for_retention(session):
+    """
+    Start the retention transaction with new polls blocked until it commits.
+    SQLite: the database write lock (BEGIN IMMEDIATE). PostgreSQL: a SHARE ROW EXCLUSIVE
+    lock on store_status, reads go on but inserts wait.
+    """
+    begin_write(session)
+    if session.get_bind().dialect.name != "sqlite":
+        session.execute(text("LOCK TABLE store_status IN SHARE ROW EXCLUSIVE MODE"))
+
+
+def run_retention(retention_hours: int = RETENTION_HOURS, archive: bool = ARCHIVE_ENABLED,
+                  allow_full_vacuum: bool = True) -> dict:
+    """
+    Retention job for store_status.
+
+    Steps followed:
+    1. Find cutoff = latest poll - retention_hours (floored to the hour).
+    2. Archive raw polls older than the cutoff (optional).
+    3. Roll them up into hourly aggregates and delete them.
+    Steps 1-3 run in one write transaction (lock_for_retention), so no poll can slip in between.
+    allow_full_vacuum=False skips the one time full VACUUM of an old SQLite file (see vacuum_database).
+    4. Run incremental vacuum to free the space and rebuild the incidents.
+    """
+    if retention_hours < MIN_RETENTION_HOURS:
+        raise ValueError(f"retention_hours must be at least {MIN_RETENTION_HOURS} (reports look back one week)")
+
+    print("🔄 Starting store_status retention job...")
+    start_time = datetime.now()
+
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    archive_files = []
+
+    try:
+        # archive, rollup and delete must see the same rows: a late poll older than the cutoff
+        # inserted after the archive was read would otherwise be deleted without being archived
+        lock_for_retention(session)
+        cutoff = get_retention_cutoff(session, retention_hours)
+        if cutoff is None:
+            print("No store status data, nothing to do")
+            return {"cutoff": None, "rolled_up": 0, "deleted": 0, "archive_files": [], "vacuum": None}
+
+        archive_files = archive_raw_polls(session, cutoff) if archive else []
+
+        rolled_up = rollup_raw_polls(session, cutoff)
+        deleted = session.execute(
+            delete(StoreStatus).where(StoreStatus.timestamp_utc < cutoff)
+        ).rowcount
+        session.commit()
+        publish_archive(archive_files)
+        print(f"✅ Rolled up {rolled_up} polls older than {cutoff}, deleted {deleted} raw rows")
+
+        if deleted:
+            # first poll / daily counts of many stores changed
+            refresh_store_metadata(session, full=True)
+
+    except Exception as e:
+        session.rollback()
+        discard_archive(archive_files)
+        print(f"❌ Error running retention job: {e}")
+        raise
+
+    finally:
+        session.close()
+
+    vacuum = None
+    if deleted:
+        vacuum = vacuum_database(allow_full_vacuum)
+        # incidents still reference the deleted polls
+        from app.incidents import rebuild_incidents
+        rebuild_incidents()
+
+    print(f"📊 Retention job finished in {(datetime.now() - start_time)} sec")
+    return {
+        "cutoff": cutoff,
+        "rolled_up": rolled_up,
+        "deleted": deleted,
+        "archive_files": archive_files,
+        "vacuum": vacuum,
+    }
+
+
+if __name__ == "__main__":
+    run_retention()
@@ -0,0 +1,265 @@
+import os
+import shutil
+import zlib
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import func
+
+from app.config import REPORT_SHARDS, REPORT_SHARED_DIR, SHARD_MAX_ATTEMPTS, REPORT_JOB_TIMEOUT
+from app.database import SessionLocal
+from app.events import notify_report_finished
+from app.models import ReportStatus, ReportShard, StoreStatus
+from app.store_metadata import refresh_store_metadata, get_report_store_ids
+
+# store_id hashes are crc32 values in [0, HASH_SPACE)
+HASH_SPACE = 2 ** 32
+
+
+def store_hash(store_id: str) -> int:
+    """Stable hash of a store id, same on every node and Python process"""
+    return zlib.crc32(store_id.encode("utf-8"))
+
+
+def hash_ranges(num_shards: int) -> list:
+    """Split the hash space into num_shards contiguous [start, end) ranges"""
+    return [
+        (i * HASH_SPACE // num_shards, (i + 1) * HASH_SPACE // num_shards)
+        for i in range(num_shards)
+    ]
+
+
+def create_shards(session, report_id: str, num_shards: int = REPORT_SHARDS) -> int:
+    """
+    Coordinator step for a claimed report: record one Queued shard per hash range.
+    All shards share the same "current time" and the store list taken here, so the
+    partial results fit together even if store_metadata changes while shards run.
+    Safe to call again for the same report (e.g. coordinator crashed halfway), existing shards are kept.
+    """
+    existing = session.query(ReportShard).filter(ReportShard.report_id == report_id).count()
+    values = {}
+    if existing == 0:
+        refresh_store_metadata(session)
+        store_ids = get_report_store_ids(session)
+        values = {
+            ReportStatus.stores_total: len(store_ids),
+            ReportStatus.stores_processed: 0,
+        }
+        current_time = session.query(func.max(StoreStatus.timestamp_utc)).scalar() or datetime.now(timezone.utc)
+
+        for shard_index, (hash_start, hash_end) in enumerate(hash_ranges(num_shards)):
+            session.add(ReportShard(
+                report_id=report_id,
+                shard_index=shard_index,
+                hash_start=hash_start,
+                hash_end=hash_end,
+                current_time_utc=current_time,
+                store_ids="\n".join(
+                    store_id for store_id in store_ids if hash_start <= store_hash(store_id) < hash_end
+                ),
+                status="Queued",
+                attempts=0
+            ))
+        existing = num_shards
+
+    values[ReportStatus.num_shards] = existing
+    session.query(ReportStatus).filter(ReportStatus.report_id == report_id).update(
+        values, synchronize_session=False
+    )
+    session.commit()
+    print(f"🧩 Report {report_id} split into {existing} shards")
+    return existing
+
+
+def claim_next_shard(session, worker_id: str):
+    """
+    Claim the oldest Queued shard with a conditional Queued -> Running UPDATE.
+    Returns the shard id or None if there is nothing to do.
+    """
+    candidates = session.query(ReportShard.id).filter(
+        ReportShard.status == "Queued"
+    ).order_by(ReportShard.id).limit(10).all()
+
+    for (shard_id,) in candidates:
+        claimed = session.query(ReportShard).filter(
+            ReportShard.id == shard_id,
+            ReportShard.status == "Queued"
+        ).update({
+            ReportShard.status: "Running",
+            ReportShard.attempts: ReportShard.attempts + 1,
+            ReportShard.worker_id: worker_id,
+            ReportShard.claimed_at: datetime.now(timezone.utc),
+        }, synchronize_session=False)
+        session.commit()
+
+        if claimed == 1:
+            return shard_id
+
+    return None
+
+
+def requeue_stale_shards(session, timeout_seconds: int = REPORT_JOB_TIMEOUT) -> int:
+    """
+    Recover work from workers that died.
+    Running shards older than the timeout go back to Queued (or Error once they
+    used all SHARD_MAX_ATTEMPTS), reports stuck in Merging go back to Running so
+    another worker redoes the merge.
+    """
+    stale_before = datetime.now(timezone.utc) - timedelta(seconds=timeout_seconds)
+    stale = session.query(ReportShard).filter(
+        ReportShard.status == "Running",
+        ReportShard.claimed_at < stale_before
+    )
+    failed = stale.filter(ReportShard.attempts >= SHARD_MAX_ATTEMPTS).update({
+        ReportShard.status: "Error",
+        ReportShard.error: "worker timed out",
+    }, synchronize_session=False)
+    requeued = stale.update({
+        ReportShard.status: "Queued",
+        ReportShard.worker_id: None,
+    }, synchronize_session=False)
+
+    session.query(ReportStatus).filter(
+        ReportStatus.status == "Merging",
+        ReportStatus.started_at < stale_before
+    ).update({ReportStatus.status: "Running"}, synchronize_session=False)
+    session.commit()
+
+    if requeued or failed:
+        print(f"♻️ Re-queued {requeued} stale shard(s), {failed} shard(s) out of attempts")
+    return requeued
+
+
+def run_shard(shard_id: int):
+    """
+    Generate the partial report of one shard: the stores the coordinator assigned to it.
+    On failure the shard is re-queued until it has used SHARD_MAX_ATTEMPTS.
+    The result is only recorded if this claim (same attempt) still holds the shard:
+    a shard re-queued as stale and claimed again is finished by its new owner only.
+    """
+    session = SessionLocal()
+    try:
+        shard = session.query(ReportShard).filter(ReportShard.id == shard_id).first()
+        report_id, shard_index, attempt, worker_id = shard.report_id, shard.shard_index, shard.attempts, shard.worker_id
+        print(f"🧩 Processing shard {shard_index} of report {report_id} (attempt {attempt})")
+        still_claimed = session.query(ReportShard).filter(
+            ReportShard.id == shard_id,
+            ReportShard.status == "Running",
+            ReportShard.attempts == attempt
+        )
+
+        try:
+            store_ids = [store_id for store_id in shard.store_ids.split("\n") if store_id]
+            path = os.path.join(REPORT_SHARED_DIR, report_id, f"part-{shard_index:05d}.csv")
+
+            # imported here so pandas/numpy only get loaded once a report actually runs
+            from app.report_generator import generate_partial_report
+            generate_partial_report(store_ids, path, shard.current_time_utc)
+
+            completed = still_claimed.update({
+                ReportShard.status: "Complete",
+                ReportShard.file_path: path,
+                ReportShard.completed_at: datetime.now(timezone.utc),
+                ReportShard.error: None,
+            }, synchronize_session=False)
+            if completed == 1:
+                # progress for /reports/{id}/events, incremented in SQL since shards finish concurrently
+                session.query(ReportStatus).filter(ReportStatus.report_id == report_id).update(
+                    {ReportStatus.stores_processed: func.coalesce(ReportStatus.stores_processed, 0) + len(store_ids)},
+                    synchronize_session=False
+                )
+                print(f"✅ Shard {shard_index} of report {report_id} done ({len(store_ids)} stores)")
+            else:
+                print(f"⚠️ Shard {shard_index} of report {report_id} was re-queued meanwhile, result dropped")
+
+        except Exception as e:
+            status = "Queued" if attempt < SHARD_MAX_ATTEMPTS else "Error"
+            still_claimed.update({
+                ReportShard.status: status,
+                ReportShard.worker_id: None,
+                ReportShard.error: str(e)[:500],
+            }, synchronize_session=False)
+            print(f"❌ Shard {shard_index} of report {report_id} failed ({status}): {e}")
+
+        session.commit()
+        finalize_report(session, report_id, worker_id)
+
+    finally:
+        session.close()
+
+
+def finalize_report(session, report_id: str, worker_id: str = None) -> bool:
+    """
+    Merge step: once every shard of a report is Complete, concatenate the partial
+    files (in shard order) into the final report that /get_report serves, then delete the partial files.
+    The merge is claimed with a conditional Running -> Merging UPDATE, so only one
+    worker performs it. A shard in Error fails the whole report.
+    Returns True if this call completed the report.
+    """
+    counts = dict(session.query(ReportShard.status, func.count()).filter(
+        ReportShard.report_id == report_id
+    ).group_by(ReportShard.status).all())
+    total = sum(counts.values())
+
+    if counts.get("Error"):
+        failed = session.query(ReportStatus).filter(
+            ReportStatus.report_id == report_id,
+            ReportStatus.status == "Running"
+        ).update({
+            ReportStatus.status: "Error",
+            ReportStatus.completed_at: datetime.now(timezone.utc),
+        }, synchronize_session=False)
+        session.commit()
+        if failed == 1:
+            notify_report_finished(session.query(ReportStatus).filter(ReportStatus.report_id == report_id).first())
+        return False
+
+    if total == 0 or counts.get("Complete", 0) != total:
+        return False
+
+    claimed = session.query(ReportStatus).filter(
+        ReportStatus.report_id == report_id,
+        ReportStatus.status == "Running"
+    ).update({
+        ReportStatus.status: "Merging",
+        ReportStatus.started_at: datetime.now(timezone.utc),
+        ReportStatus.worker_id: worker_id,
+    }, synchronize_session=False)
+    session.commit()
+    if claimed != 1:
+        return False
+
+    report = session.query(ReportStatus).filter(ReportStatus.report_id == report_id).first()
+    try:
+        part_paths = [
+            shard.file_path for shard in session.query(ReportShard).filter(
+                ReportShard.report_id == report_id
+            ).order_by(ReportShard.shard_index)
+        ]
+        from app.report_generator import merge_report_parts
+        filename = merge_report_parts(
+            part_paths, os.path.join(REPORT_SHARED_DIR, f"store_report_{report_id}.csv")
+        )
+
+        report.status = "Complete"
+        report.file_path = filename
+        print(f"✅ Report {report_id} merged from {len(part_paths)} shards -> {filename}")
+
+    except Exception as e:
+        report.status = "Error"
+        print(f"❌ Merging report {report_id} failed: {e}")
+
+    report.completed_at = datetime.now(timezone.utc)
+    session.commit()
+    if report.status == "Complete":
+        # the merged file has everything, don't keep a second copy on the shared disk
+        shutil.rmtree(os.path.join(REPORT_SHARED_DIR, report_id), ignore_errors=True)
+    notify_report_finished(report)
+    return report.status == "Complete"
+
+
+def finalize_pending_reports(session, worker_id: str = None) -> int:
+    """Run the merge step for every sharded report that is still Running"""
+    report_ids = [row[0] for row in session.query(ReportStatus.report_id).filter(
+        ReportStatus.status == "Running",
+        ReportStatus.num_shards.isnot(None)
+    ).all()]
+    return sum(finalize_report(session, report_id, worker_id) for report_id in report_ids)
@@ -0,0 +1,154 @@
+from datetime import datetime, timezone
+from sqlalchemy import select, delete, update, func, exists, literal, case, DateTime
+
+from app.database import SessionLocal, insert_for_dialect, begin_write
+from app.models import (
+    StoreStatus,
+    BusinessHours,
+    StoreTimezone,
+    StoreMetadata,
+    StoreDailyPolls,
+    StoreMetadataState,
+)
+
+
+def _new_polls(query, id_range):
+    """Restrict an aggregate to store_status ids in (start, end] when given"""
+    if id_range is not None:
+        query = query.where(StoreStatus.id > id_range[0], StoreStatus.id <= id_range[1])
+    return query
+
+
+def _poll_aggregates(id_range: tuple = None):
+    """
+    SELECT of first/last poll and poll count per store,
+    only polls with ids in id_range when given (incremental refresh).
+    """
+    now = literal(datetime.now(timezone.utc), DateTime)
+    query = select(
+        StoreStatus.store_id,
+        func.min(StoreStatus.timestamp_utc),
+        func.max(StoreStatus.timestamp_utc),
+        func.count(),
+        exists().where(BusinessHours.store_id == StoreStatus.store_id),
+        exists().where(StoreTimezone.store_id == StoreStatus.store_id),
+        now,
+    ).group_by(StoreStatus.store_id)
+    return _new_polls(query, id_range)
+
+
+def _daily_aggregates(id_range: tuple = None):
+    """SELECT of poll count per store per UTC day, only polls with ids in id_range when given"""
+    day = func.date(StoreStatus.timestamp_utc)
+    query = select(StoreStatus.store_id, day, func.count()).group_by(StoreStatus.store_id, day)
+    return _new_polls(query, id_range)
+
+
+def _earliest(a, b):
+    """Portable LEAST() of two columns (SQLite has no LEAST)"""
+    return case((a < b, a), else_=b)
+
+
+def _latest(a, b):
+    """Portable GREATEST() of two columns"""
+    return case((a > b, a), else_=b)
+
+
+METADATA_COLUMNS = ["store_id", "first_poll_utc", "last_poll_utc", "poll_count",
+                    "has_business_hours", "has_timezone", "updated_at"]
+DAILY_COLUMNS = ["store_id", "day_utc", "poll_count"]
+
+
+def refresh_store_metadata(session, full: bool = False) -> str:
+    """
+    Bring store_metadata and store_daily_polls up to date with store_status.
+
+    Incremental (default): only polls whose store_status.id is above the high-water
+    mark in store_metadata_state are aggregated and added with ON CONFLICT upserts,
+    so regular ingestion only costs a range scan over the new rows. Going by id
+    instead of timestamp also picks up polls that arrive late (older timestamps).
+    Full: both tables are rebuilt with one GROUP BY each. Needed after polls
+    were deleted (retention) or reloaded (load_data).
+    Business hours / timezone flags are recomputed in both modes.
+
+    The high-water mark is read and advanced in the same write transaction as the
+    upserts (BEGIN IMMEDIATE on SQLite, SELECT ... FOR UPDATE on PostgreSQL), so
+    concurrent refreshes (workers, coordinators) never count the same polls twice.
+    Returns "full", "incremental" or "fresh" (nothing to do).
+    """
+    begin_write(session)
+    now = datetime.now(timezone.utc)
+    state_table = StoreMetadataState.__table__
+    session.execute(
+        insert_for_dialect(state_table).values(id=1, last_status_id=-1, updated_at=now)
+        .on_conflict_do_nothing(index_elements=["id"])
+    )
+    state = session.query(StoreMetadataState).filter(StoreMetadataState.id == 1).with_for_update().one()
+    max_id = session.query(func.max(StoreStatus.id)).scalar() or 0
+
+    if state.last_status_id < 0 or full:
+        mode = "full"
+        session.execute(delete(StoreMetadata))
+        session.execute(delete(StoreDailyPolls))
+        session.execute(insert_for_dialect(StoreMetadata.__table__).from_select(METADATA_COLUMNS, _poll_aggregates()))
+        session.execute(insert_for_dialect(StoreDailyPolls.__table__).from_select(DAILY_COLUMNS, _daily_aggregates()))
+
+    elif max_id > state.last_status_id:
+        mode = "incremental"
+        id_range = (state.last_status_id, max_id)
+        table = StoreMetadata.__table__
+        stmt = insert_for_dialect(table).from_select(METADATA_COLUMNS, _poll_aggregates(id_range))
+        # late polls can be older than what is already known, so widen the range both ways
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=["store_id"],
+            set_={
+                "first_poll_utc": _earliest(table.c.first_poll_utc, stmt.excluded.first_poll_utc),
+                "last_poll_utc": _latest(table.c.last_poll_utc, stmt.excluded.last_poll_utc),
+                "poll_count": table.c.poll_count + stmt.excluded.poll_count,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        ))
+
+        daily = StoreDailyPolls.__table__
+        stmt = insert_for_dialect(daily).from_select(DAILY_COLUMNS, _daily_aggregates(id_range))
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=["store_id", "day_utc"],
+            set_={"poll_count": daily.c.poll_count + stmt.excluded.poll_count},
+        ))
+
+    else:
+        mode = "fresh"
+
+    if mode != "full":
+        # business hours / timezones may have been (re)loaded without new polls
+        session.execute(update(StoreMetadata).values(
+            has_business_hours=exists().where(BusinessHours.store_id == StoreMetadata.store_id),
+            has_timezone=exists().where(StoreTimezone.store_id == StoreMetadata.store_id),
+        ))
+
+    state.last_status_id = max_id
+    state.updated_at = now
+    session.commit()
+    if mode != "fresh":
+        print(f"✅ Store metadata refreshed ({mode})")
+    return mode
+
+
+def get_report_store_ids(session) -> list:
+    """
+    Stores that go into the report: stores with polls, business hours and a timezone.
+    Index scan on store_metadata instead of a JOIN + DISTINCT over store_status.
+    """
+    rows = session.query(StoreMetadata.store_id).filter(
+        StoreMetadata.has_business_hours.is_(True),
+        StoreMetadata.has_timezone.is_(True)
+    ).order_by(StoreMetadata.store_id).all()
+    return [row[0] for row in rows]
+
+
+if __name__ == "__main__":
+    session = SessionLocal()
+    try:
+        refresh_store_metadata(session, full=True)
+    finally:
+        session.close()
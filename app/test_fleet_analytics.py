@@ -0,0 +1,183 @@
+import json
+from datetime import timedelta
+
+import app.fleet_analytics as fleet_analytics
+from app.fleet_analytics import _fleet_stats, _by_timezone, _by_weekday, _window_params
+from app.models import StoreStatus
+from app.store_metadata import refresh_store_metadata
+from app.testing import temp_database, api_server, add_store, http, SEED_NOW
+
+NOW = SEED_NOW
+
+# store -> active polls out of 10 in the last week
+ACTIVE_POLLS = {
+    "store-down": 0,
+    "store-30": 3,
+    "store-50a": 5,
+    "store-50b": 5,
+    "store-70": 7,
+    "store-90": 9,
+    "store-100a": 10,
+    "store-100b": 10,
+    "store-100c": 10,
+}
+# polls only before the last week -> 0% uptime like in the CSV report
+IDLE_STORE = "store-idle"
+# everything else is in America/Chicago
+KOLKATA_STORES = {"store-30", "store-90", "store-100a"}
+
+
+def seed_fleet(session):
+    """Stores with known last week uptime ratios, 24x7 business hours"""
+    for store_id in [*ACTIVE_POLLS, IDLE_STORE]:
+        add_store(session, store_id, "Asia/Kolkata" if store_id in KOLKATA_STORES else "America/Chicago")
+
+    for store_id, active in ACTIVE_POLLS.items():
+        for n in range(10):
+            session.add(StoreStatus(store_id=store_id, status="active" if n < active else "inactive",
+                                    timestamp_utc=NOW - timedelta(hours=12 * n + 1)))
+    for n in range(10):
+        session.add(StoreStatus(store_id=IDLE_STORE, status="active",
+                                timestamp_utc=NOW - timedelta(days=8, hours=n)))
+    session.commit()
+
+    refresh_store_metadata(session, full=True)
+
+
+def test_fleet_stats():
+    """
+    Fleet summary aggregates.
+    This script checks:
+    1. Nearest-rank percentiles over the per store uptime ratios.
+    2. Stores without polls in the window count as zero uptime.
+    3. Histogram buckets are [low, high), the last one also takes 100% uptime.
+    """
+    print("🧪 Testing fleet stats...")
+
+    with temp_database() as db:
+        session = db.session
+        seed_fleet(session)
+
+        stats = _fleet_stats(session, _window_params(NOW))
+        week = stats["windows"]["last_week"]
+        # sorted ratios: 0, 0, .3, .5, .5, .7, .9, 1, 1, 1 -> in hours of the 168 hour week
+        assert stats["total_stores"] == 10
+        assert week["uptime_percentiles"] == {"p5": 0.0, "p25": 50.4, "p50": 84.0, "p75": 168.0, "p95": 168.0}
+        assert week["zero_uptime_stores"] == 2
+        assert week["avg_uptime"] == round(5.9 / 10 * 168, 2)
+
+        histogram = {bucket["uptime_pct"]: bucket["stores"] for bucket in week["uptime_histogram"]}
+        assert histogram == {
+            "0-10": 2, "10-20": 0, "20-30": 0, "30-40": 1, "40-50": 0,
+            "50-60": 2, "60-70": 0, "70-80": 1, "80-90": 0, "90-100": 4,
+        }, histogram
+        print(f"✅ p50 {week['uptime_percentiles']['p50']}h, p95 {week['uptime_percentiles']['p95']}h, "
+              f"{histogram['90-100']} stores in 90-100%")
+
+
+
+def test_by_timezone_and_weekday():
+    """Average uptime per timezone and poll counts per UTC weekday over the last week"""
+    with temp_database() as db:
+        session = db.session
+        seed_fleet(session)
+        params = _window_params(NOW)
+
+        # Chicago: 0, .5, .5, .7, 1, 1 and store-idle 0 -> 3.7 / 7, Kolkata: .3, .9, 1 -> 2.2 / 3
+        by_timezone = _by_timezone(session, params)
+        assert [(row["timezone"], row["stores"]) for row in by_timezone] == [("America/Chicago", 7), ("Asia/Kolkata", 3)]
+        assert by_timezone[0]["avg_uptime_last_week(in hours)"] == round(3.7 / 7 * 168, 2)
+        assert by_timezone[1]["avg_uptime_last_week(in hours)"] == round(2.2 / 3 * 168, 2)
+
+        # polls every 12 hours from 11:00 Wednesday back to 23:00 Friday
+        expected = {}
+        for store_id, active in ACTIVE_POLLS.items():
+            for n in range(10):
+                weekday = (NOW - timedelta(hours=12 * n + 1)).weekday()
+                polls, active_polls = expected.get(weekday, (0, 0))
+                expected[weekday] = (polls + 1, active_polls + (n < active))
+        by_weekday = _by_weekday(session, params)
+        assert {row["weekday_utc"]: (row["polls"], row["active_polls"]) for row in by_weekday} == expected
+        assert [row["name"] for row in by_weekday] == ["Monday", "Tuesday", "Wednesday", "Friday", "Saturday", "Sunday"]
+        assert sum(row["polls"] for row in by_weekday) == 90  # store-idle's polls are older than a week
+
+
+def test_fleet_summary_cached_until_data_changes():
+    """get_fleet_summary computes once per (watermark, latest poll id, metadata state)"""
+    with temp_database() as db:
+        session = db.session
+        seed_fleet(session)
+
+        computed = []
+        compute = fleet_analytics.compute_fleet_summary
+
+        def counting_compute(session, current_time):
+            computed.append(current_time)
+            return compute(session, current_time)
+
+        fleet_analytics.compute_fleet_summary = counting_compute
+        fleet_analytics._summary_cache.clear()
+        try:
+            first = fleet_analytics.get_fleet_summary(session)
+            assert fleet_analytics.get_fleet_summary(session) is first
+            assert len(computed) == 1 and first["total_stores"] == 10
+
+            # late poll of a new store: same watermark, the new id misses the cache
+            add_store(session, "store-new")
+            session.add(StoreStatus(store_id="store-new", status="active", timestamp_utc=NOW - timedelta(hours=5)))
+            session.commit()
+            second = fleet_analytics.get_fleet_summary(session)
+            assert len(computed) == 2 and second["total_stores"] == 11
+            assert fleet_analytics.get_fleet_summary(session) is second
+        finally:
+            fleet_analytics.compute_fleet_summary = compute
+            fleet_analytics._summary_cache.clear()
+
+
+def get_summary(base_url: str) -> dict:
+    _, body = http("GET", f"{base_url}/fleet/summary")
+    return json.loads(body)
+
+
+def test_fleet_summary_endpoint_follows_stores_and_polls():
+    """
+    GET /fleet/summary on a database whose store_metadata was never built, then after
+    a late poll of a new store (same watermark), an out of band metadata refresh and a newer poll
+    """
+    with temp_database(num_stores=6) as db, api_server(db) as base_url:
+        session = db.session
+
+        summary = get_summary(base_url)
+        assert summary["total_stores"] == 6, summary["total_stores"]
+        assert summary["watermark"] == SEED_NOW.isoformat()
+
+        # late poll: older than the watermark, only the store_status id changes
+        add_store(session, "store-late")
+        session.add(StoreStatus(store_id="store-late", status="active", timestamp_utc=SEED_NOW - timedelta(hours=2)))
+        session.commit()
+        summary = get_summary(base_url)
+        assert summary["total_stores"] == 7 and summary["watermark"] == SEED_NOW.isoformat()
+
+        # metadata refreshed by another process (report / load job) before the API sees the new store
+        add_store(session, "store-other")
+        session.add(StoreStatus(store_id="store-other", status="active", timestamp_utc=SEED_NOW - timedelta(hours=3)))
+        session.commit()
+        refresh_store_metadata(session)
+        assert get_summary(base_url)["total_stores"] == 8
+
+        # newer poll moves the watermark, the windows are recomputed from it
+        session.add(StoreStatus(store_id="store-late", status="active", timestamp_utc=SEED_NOW + timedelta(hours=1)))
+        session.commit()
+        summary = get_summary(base_url)
+        assert summary["watermark"] == (SEED_NOW + timedelta(hours=1)).isoformat()
+        # last hour is now 12:00 - 13:00: store-000/003 (inactive at 12:00) and store-other (no poll) are down
+        assert summary["windows"]["last_hour"]["zero_uptime_stores"] == 3
+        print("✅ /fleet/summary follows new stores, late polls and metadata refreshes")
+
+
+if __name__ == "__main__":
+    # run the tests
+    test_fleet_stats()
+    test_by_timezone_and_weekday()
+    test_fleet_summary_cached_until_data_changes()
+    test_fleet_summary_endpoint_follows_stores_and_polls()
@@ -0,0 +1,113 @@
+from datetime import datetime, time as dtime
+
+import pandas as pd
+from sqlalchemy import inspect
+
+from app.incidents import extract_incidents, complete_store_batches, business_overlap_minutes
+from app.models import StoreStatus, Incident, IncidentsState
+from app.testing import temp_database
+
+WATERMARK = datetime(2023, 1, 2, 6, 0)
+
+# store-a ends inactive right before store-b starts inactive (store boundary),
+# store-b has enough polls to span several batches, store-c is still down,
+# store-d has the latest poll (the watermark)
+POLLS = [
+    ("store-a", "active", datetime(2023, 1, 2, 0, 0)),
+    ("store-a", "inactive", datetime(2023, 1, 2, 1, 0)),
+    ("store-a", "inactive", datetime(2023, 1, 2, 2, 0)),
+    ("store-a", "active", datetime(2023, 1, 2, 3, 0)),
+    ("store-a", "inactive", datetime(2023, 1, 2, 4, 0)),
+    ("store-b", "inactive", datetime(2023, 1, 2, 0, 0)),
+    ("store-b", "inactive", datetime(2023, 1, 2, 1, 0)),
+    ("store-b", "active", datetime(2023, 1, 2, 2, 0)),
+    ("store-b", "inactive", datetime(2023, 1, 2, 3, 0)),
+    ("store-b", "inactive", datetime(2023, 1, 2, 4, 0)),
+    ("store-b", "active", datetime(2023, 1, 2, 5, 0)),
+    ("store-c", "active", datetime(2023, 1, 2, 4, 0)),
+    ("store-c", "inactive", datetime(2023, 1, 2, 5, 0)),
+    ("store-d", "active", WATERMARK),
+]
+
+# (store_id, start, end, poll_count, is_ongoing)
+EXPECTED = [
+    ("store-a", datetime(2023, 1, 2, 1, 0), datetime(2023, 1, 2, 3, 0), 2, False),
+    ("store-a", datetime(2023, 1, 2, 4, 0), WATERMARK, 1, True),
+    ("store-b", datetime(2023, 1, 2, 0, 0), datetime(2023, 1, 2, 2, 0), 2, False),
+    ("store-b", datetime(2023, 1, 2, 3, 0), datetime(2023, 1, 2, 5, 0), 2, False),
+    ("store-c", datetime(2023, 1, 2, 5, 0), WATERMARK, 1, True),
+]
+
+
+def polls_frame():
+    return pd.DataFrame(POLLS, columns=["store_id", "status", "timestamp_utc"])
+
+
+def as_tuples(incidents):
+    return [
+        (row.store_id, pd.Timestamp(row.start_utc).to_pydatetime(), pd.Timestamp(row.end_utc).to_pydatetime(),
+         int(row.poll_count), bool(row.is_ongoing))
+        for row in incidents.itertuples(index=False)
+    ]
+
+
+def test_extract_incidents():
+    """Runs split at store boundaries, a store's latest inactive run is ongoing until the watermark"""
+    incidents = extract_incidents(polls_frame(), WATERMARK)
+    assert as_tuples(incidents) == EXPECTED
+    assert list(incidents["duration_minutes"]) == [120, 120, 120, 120, 60]
+
+
+def test_batches_never_split_a_store():
+    """Stores cut by the batch size are carried over, the result equals one big batch"""
+    polls = polls_frame()
+    for batch_size in (1, 2, 3, 5):
+        raw_batches = [polls.iloc[i:i + batch_size] for i in range(0, len(polls), batch_size)]
+        batches = list(complete_store_batches(raw_batches))
+        stores_per_batch = [set(batch["store_id"]) for batch in batches]
+        assert all(not (a & b) for i, a in enumerate(stores_per_batch) for b in stores_per_batch[i + 1:])
+
+        incidents = pd.concat([extract_incidents(batch, WATERMARK) for batch in batches], ignore_index=True)
+        assert as_tuples(incidents) == EXPECTED, batch_size
+
+
+def test_business_overlap_across_midnight():
+    """Overnight business hours (22:00 - 02:00) count on both sides of midnight"""
+    # 2023-01-02 is a Monday
+    day_hours = {0: [(dtime(22, 0), dtime(2, 0))]}
+    minutes = business_overlap_minutes(datetime(2023, 1, 2, 23, 0), datetime(2023, 1, 3, 1, 30), "UTC", day_hours)
+    assert minutes == 150
+
+    # the part before opening and after closing is not counted
+    minutes = business_overlap_minutes(datetime(2023, 1, 2, 20, 0), datetime(2023, 1, 3, 4, 0), "UTC", day_hours)
+    assert minutes == 240
+
+    # no business hours -> open 24x7
+    assert business_overlap_minutes(datetime(2023, 1, 2, 0, 0), datetime(2023, 1, 2, 1, 0), "UTC", None) == 60
+
+
+def test_rebuild_incidents_small_batches():
+    """rebuild_incidents with a tiny BATCH_SIZE gives the same incidents and records its watermark"""
+    with temp_database() as db:
+        session = db.session
+        session.add_all(StoreStatus(store_id=s, status=st, timestamp_utc=ts) for s, st, ts in POLLS)
+        # old incident that the rebuild has to replace
+        session.add(Incident(store_id="gone", start_utc=WATERMARK, end_utc=WATERMARK, duration_minutes=0,
+                             poll_count=1, business_minutes=0, is_ongoing=True))
+        session.commit()
+
+        db.run(["-c", "import app.incidents as i; i.BATCH_SIZE = 3; i.rebuild_incidents()"])
+
+        rows = session.query(Incident).order_by(Incident.store_id, Incident.start_utc).all()
+        assert [(r.store_id, r.start_utc, r.end_utc, r.poll_count, r.is_ongoing) for r in rows] == EXPECTED
+        assert session.query(IncidentsState.watermark).scalar() == WATERMARK
+        # the staging table is gone
+        assert [name for name in inspect(session.get_bind()).get_table_names() if name.startswith("incidents_staging")] == []
+
+
+if __name__ == "__main__":
+    # run the tests
+    test_extract_incidents()
+    test_batches_never_split_a_store()
+    test_business_overlap_across_midnight()
+    test_rebuild_incidents_small_batches()
@@ -0,0 +1,67 @@
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import profile_data
+
+
+def write_status_csv(path: str, num_stores: int = 30):
+    """Small store_status.csv in random row order, timestamps in the '... UTC' format of the real file"""
+    rng = random.Random(7)
+    rows = []
+    for n in range(num_stores):
+        ts = datetime(2023, 1, 18)
+        for _ in range(rng.randint(1, 80)):
+            ts += timedelta(seconds=rng.randint(600, 40000))
+            rows.append((f"store-{n:03d}", rng.choice(["active", "inactive"]),
+                         ts.strftime("%Y-%m-%d %H:%M:%S.%f") + " UTC"))
+    rng.shuffle(rows)
+    pd.DataFrame(rows, columns=["store_id", "status", "timestamp_utc"]).to_csv(path, index=False)
+
+
+def test_profile_same_for_any_number_of_workers():
+    """
+    Streaming profiler for store_status.csv.
+    This script checks:
+    1. --workers 1 and --workers N give the same profile (several partitions, several byte ranges).
+    2. Gap statistics match numpy on the whole file loaded and sorted in memory.
+    """
+    print("🧪 Testing store status profiler...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "store_status.csv")
+        write_status_csv(path)
+
+        original_partition_bytes = profile_data.PARTITION_BYTES
+        profile_data.PARTITION_BYTES = 10000  # force several partitions on a small file
+        try:
+            single = profile_data.profile_status_csv(path, workers=1).summary(per_store=True)
+            parallel = profile_data.profile_status_csv(path, workers=3).summary(per_store=True)
+        finally:
+            profile_data.PARTITION_BYTES = original_partition_bytes
+
+        assert single == parallel
+
+        # reference: whole file in memory
+        df = pd.read_csv(path)
+        df["ts"] = profile_data.parse_timestamps(df["timestamp_utc"])
+        df = df.sort_values(["store_id", "ts"])
+        gaps = df.groupby("store_id")["ts"].diff().dropna().to_numpy() / 3600
+
+        assert single["rows"] == len(df)
+        assert single["unique_stores"] == df["store_id"].nunique()
+        assert single["poll_gaps_hours"]["median"] == round(float(np.median(gaps)), 3)
+        assert single["poll_gaps_hours"]["p95"] == round(float(np.percentile(gaps, 95)), 3)
+        assert single["poll_gaps_hours"]["max"] == round(float(gaps.max()), 3)
+        assert sum(single["poll_gaps_hours"]["histogram"].values()) == len(gaps)
+        assert {s: v["polls"] for s, v in single["per_store"].items()} == df["store_id"].value_counts().to_dict()
+        print("✅ Profile matches for 1 and 3 workers and the in-memory reference")
+
+
+if __name__ == "__main__":
+    # run the test
+    test_profile_same_for_any_number_of_workers()
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import quote
+
+from app.events import ReportEventBus
+from app.testing import temp_database, api_server, start_worker, stop_processes, http, wait_until
+
+
+def read_events(response):
+    """Parse a server-sent events stream into a list of report events"""
+    events = []
+    for raw_line in response:
+        line = raw_line.decode().strip()
+        if line.startswith("data: "):
+            events.append(json.loads(line[len("data: "):]))
+    return events
+
+
+def test_report_notifications():
+    """
+    Push based report notifications.
+    This script checks:
+    1. GET /reports/{id}/events streams Queued -> progress -> Complete and then closes.
+    2. GET /get_report?wait=... answers as soon as the report is done (and after `wait` otherwise).
+    3. The callback_url given to /trigger_report gets a JSON POST when the report finishes.
+    """
+    print("🧪 Testing report events, long polling and webhooks...")
+
+    # webhook receiver
+    received = []
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    webhook_server = HTTPServer(("127.0.0.1", 0), WebhookHandler)
+    threading.Thread(target=webhook_server.serve_forever, daemon=True).start()
+    callback_url = f"http://127.0.0.1:{webhook_server.server_port}/done"
+
+    env = {"REPORT_EXECUTION": "worker", "REPORT_EVENTS_POLL_INTERVAL": "0.2", "REPORT_PROGRESS_INTERVAL": "0",
+           "SSE_KEEPALIVE_SECONDS": "1", "WEBHOOK_ALLOWED_HOSTS": "127.0.0.1"}
+
+    with temp_database(num_stores=6) as db, api_server(db, **env) as base_url:
+        workers = []
+        try:
+            # bad parameters
+            for method, url, code in (
+                ("POST", f"{base_url}/trigger_report?callback_url={quote('ftp://127.0.0.1/done')}", 400),
+                # only hosts in WEBHOOK_ALLOWED_HOSTS, e.g. no cloud metadata service
+                ("POST", f"{base_url}/trigger_report?callback_url={quote('http://169.254.169.254/')}", 400),
+                ("GET", f"{base_url}/get_report?report_id=x&wait=1000", 400),
+                ("GET", f"{base_url}/reports/missing/events", 404),
+            ):
+                try:
+                    http(method, url)
+                    raise AssertionError(f"{url} should fail")
+                except urllib.error.HTTPError as e:
+                    assert e.code == code, (url, e.code)
+
+            _, body = http("POST", f"{base_url}/trigger_report?callback_url={quote(callback_url)}")
+            report_id = json.loads(body)["report_id"]
+
+            # no worker yet: long poll times out and returns the current status
+            start = time.time()
+            _, body = http("GET", f"{base_url}/get_report?report_id={report_id}&wait=0.5")
+            assert json.loads(body)["status"] == "Queued" and time.time() - start >= 0.5
+            print("✅ Long poll returned Queued after the wait timeout")
+
+            # the stream stays open across the worker starting and finishing the report
+            with urllib.request.urlopen(f"{base_url}/reports/{report_id}/events", timeout=30) as response:
+                assert response.headers["content-type"].startswith("text/event-stream")
+                workers.append(start_worker(db, "worker-a", **env))
+                events = read_events(response)
+
+            statuses = [event["status"] for event in events]
+            assert statuses[0] == "Queued" and statuses[-1] == "Complete", statuses
+            assert events[-1]["stores_processed"] == events[-1]["stores_total"] == 6
+            assert events[-1]["download_path"] == f"/get_report?report_id={report_id}"
+            print(f"✅ Event stream: {statuses}")
+
+            # second report: a single long poll returns the CSV once it is done
+            _, body = http("POST", f"{base_url}/trigger_report")
+            second_id = json.loads(body)["report_id"]
+            with urllib.request.urlopen(f"{base_url}/get_report?report_id={second_id}&wait=30", timeout=40) as response:
+                assert response.headers["content-type"].startswith("text/csv")
+                assert len(response.read().decode().strip().splitlines()) == 1 + 6
+            print("✅ Long poll returned the finished report")
+
+            wait_until(lambda: received, timeout=10)
+            assert len(received) == 1
+            assert received[0]["report_id"] == report_id and received[0]["status"] == "Complete"
+            print("✅ Webhook called once with the Complete event")
+
+        finally:
+            stop_processes(workers)
+            webhook_server.shutdown()
+
+
+
+def test_progress_never_goes_back():
+    """An older progress value (watcher reading the last commit) after a newer one (report thread) is dropped"""
+    async def publish_all():
+        bus = ReportEventBus()
+        queue = bus.subscribe("r1")
+        for status, stores_processed in (("Queued", None), ("Running", 150), ("Running", 100),
+                                         ("Running", 150), ("Running", 200), ("Complete", 200)):
+            bus.publish("r1", {"report_id": "r1", "status": status, "stores_processed": stores_processed,
+                               "stores_total": 200, "completed_at": None})
+        await asyncio.sleep(0)  # let the queued put_nowait callbacks run
+        events = []
+        while not queue.empty():
+            event = queue.get_nowait()
+            events.append((event["status"], event["stores_processed"]))
+        return events
+
+    assert asyncio.run(publish_all()) == [("Queued", None), ("Running", 150), ("Running", 200), ("Complete", 200)]
+
+
+if __name__ == "__main__":
+    # run the tests
+    test_report_notifications()
+    test_progress_never_goes_back()
@@ -0,0 +1,195 @@
+import json
+import os
+from datetime import datetime
+
+from app.models import StoreStatus, StoreStatusHourly
+from app.retention import run_retention
+from app.testing import temp_database, api_server, http
+
+# latest poll 2023-01-25 12:30 -> 168h back is 2023-01-18 12:30, floored to 12:00
+LATEST = datetime(2023, 1, 25, 12, 30)
+CUTOFF = datetime(2023, 1, 18, 12, 0)
+
+POLLS = [
+    ("store-a", "active", datetime(2023, 1, 18, 10, 15)),
+    ("store-a", "inactive", datetime(2023, 1, 18, 10, 45)),
+    ("store-a", "active", datetime(2023, 1, 18, 11, 59)),
+    ("store-a", "active", datetime(2023, 1, 18, 12, 10)),  # after the floored cutoff, kept
+    ("store-a", "active", LATEST),
+]
+
+RUN_RETENTION = "from app.retention import run_retention; run_retention(168)"
+
+# rollup fails after the archive files were written
+FAILING_RETENTION = """
+import app.retention as retention
+def broken_rollup(session, cutoff):
+    raise RuntimeError("rollup failed")
+retention.rollup_raw_polls = broken_rollup
+try:
+    retention.run_retention(168)
+except RuntimeError:
+    pass
+"""
+
+# a late poll older than the cutoff arrives from another connection right after the archive was read
+LATE_POLL = datetime(2023, 1, 18, 11, 30)
+LATE_POLL_RETENTION = """
+import threading, time
+from datetime import datetime
+import app.retention as retention
+from app.database import SessionLocal
+from app.models import StoreStatus
+
+def insert_late_poll():
+    session = SessionLocal()
+    session.add(StoreStatus(store_id="store-late", status="active", timestamp_utc=datetime(2023, 1, 18, 11, 30)))
+    session.commit()
+    session.close()
+
+archive_raw_polls = retention.archive_raw_polls
+def archive_then_late_poll(session, cutoff):
+    files = archive_raw_polls(session, cutoff)
+    threading.Thread(target=insert_late_poll).start()
+    time.sleep(1)  # the insert waits for the retention transaction
+    return files
+
+retention.archive_raw_polls = archive_then_late_poll
+retention.run_retention(168)
+"""
+
+
+def seed_polls(session):
+    """The polls above and an hourly row left by an earlier run"""
+    session.add_all(StoreStatus(store_id=s, status=st, timestamp_utc=ts) for s, st, ts in POLLS)
+    session.add(StoreStatusHourly(store_id="store-a", hour_utc=datetime(2023, 1, 18, 10), active_count=5,
+                                  inactive_count=1))
+    session.commit()
+
+
+def test_retention_rollup_and_delete():
+    """
+    Retention job.
+    This script checks:
+    1. The cutoff is the latest poll - retention hours, floored to the hour.
+    2. Hourly counts are added to rows already in store_status_hourly, a second run changes nothing.
+    3. Raw polls are deleted only up to the cutoff, and the archive files are complete.
+    """
+    print("🧪 Testing retention job...")
+
+    with temp_database() as db:
+        session = db.session
+        seed_polls(session)
+        archive_dir = os.path.join(db.dir, "archive")
+
+        for _ in range(2):
+            db.run(["-c", RUN_RETENTION], env=db.env(ARCHIVE_DIR=archive_dir))
+
+            session.expire_all()
+            hourly = {
+                row.hour_utc: (row.active_count, row.inactive_count)
+                for row in session.query(StoreStatusHourly)
+            }
+            assert hourly == {
+                datetime(2023, 1, 18, 10): (6, 2),  # 5 + 1 active, 1 + 1 inactive
+                datetime(2023, 1, 18, 11): (1, 0),
+            }, hourly
+
+            remaining = [row.timestamp_utc for row in session.query(StoreStatus).order_by(StoreStatus.timestamp_utc)]
+            assert remaining == [datetime(2023, 1, 18, 12, 10), LATEST]
+            assert min(remaining) >= CUTOFF
+
+        archive_files = os.listdir(archive_dir)
+        assert len(archive_files) == 1 and not archive_files[0].endswith(".tmp"), archive_files
+        assert CUTOFF.strftime("%Y%m%dT%H%M%S") in archive_files[0]
+        print(f"✅ Rolled up and archived up to {CUTOFF}: {archive_files[0]}")
+
+
+def test_failed_rollup_leaves_no_archive():
+    """Archive files of a run whose rollup fails are removed, the polls stay in store_status"""
+    with temp_database() as db:
+        session = db.session
+        seed_polls(session)
+        archive_dir = os.path.join(db.dir, "archive")
+
+        db.run(["-c", FAILING_RETENTION], env=db.env(ARCHIVE_DIR=archive_dir))
+
+        assert os.listdir(archive_dir) == []
+        assert session.query(StoreStatus).count() == len(POLLS)
+
+
+def read_archive(archive_dir: str) -> list:
+    """Polls in the archive files, as (store_id, timestamp) tuples"""
+    import pandas as pd
+    rows = []
+    for name in sorted(os.listdir(archive_dir)):
+        path = os.path.join(archive_dir, name)
+        df = pd.read_parquet(path) if name.endswith(".parquet") else pd.read_csv(path, parse_dates=["timestamp_utc"])
+        rows += [(row.store_id, pd.Timestamp(row.timestamp_utc).to_pydatetime()) for row in df.itertuples()]
+    return rows
+
+
+def test_late_poll_is_archived_or_kept():
+    """A poll older than the cutoff inserted while the job runs is never deleted without being archived"""
+    with temp_database() as db:
+        session = db.session
+        seed_polls(session)
+        archive_dir = os.path.join(db.dir, "archive")
+
+        db.run(["-c", LATE_POLL_RETENTION], env=db.env(ARCHIVE_DIR=archive_dir))
+
+        archived = read_archive(archive_dir)
+        kept = [(row.store_id, row.timestamp_utc) for row in session.query(StoreStatus)]
+        assert ("store-late", LATE_POLL) in archived + kept, (archived, kept)
+        assert len(archived) + len(kept) == len(POLLS) + 1
+
+
+def test_full_vacuum_only_from_command_line():
+    """
+    On a SQLite file not in incremental auto vacuum mode, POST /maintenance/retention skips
+    the full VACUUM (exclusive lock for the whole rewrite), `python -m app.retention` converts the file
+    """
+    with temp_database() as db:
+        session = db.session
+        seed_polls(session)
+        # database created before incremental auto vacuum was enabled
+        with session.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum = NONE")
+            conn.exec_driver_sql("VACUUM")
+
+        def auto_vacuum_mode():
+            with session.get_bind().connect() as conn:
+                return conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+
+        assert auto_vacuum_mode() == 0
+        archive_dir = os.path.join(db.dir, "archive")
+        with api_server(db, RETENTION_HOURS="168", ARCHIVE_DIR=archive_dir) as base_url:
+            _, body = http("POST", f"{base_url}/maintenance/retention")
+        result = json.loads(body)
+        assert result["deleted"] == 3 and result["vacuum"] == "skipped", result
+        assert auto_vacuum_mode() == 0
+
+        # one more old poll so the command line run has something to delete
+        session.add(StoreStatus(store_id="store-a", status="active", timestamp_utc=datetime(2023, 1, 18, 9, 0)))
+        session.commit()
+        db.run(["-m", "app.retention"], env=db.env(RETENTION_HOURS="168", ARCHIVE_DIR=archive_dir))
+        assert auto_vacuum_mode() == 2
+        print("✅ Full VACUUM skipped by the endpoint, done by python -m app.retention")
+
+
+def test_retention_shorter_than_a_week_rejected():
+    """Reports look back one week, so less than 168 hours of raw polls is refused"""
+    try:
+        run_retention(retention_hours=167)
+        raise AssertionError("retention_hours < 168 should be rejected")
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    # run the tests
+    test_retention_rollup_and_delete()
+    test_failed_rollup_leaves_no_archive()
+    test_late_poll_is_archived_or_kept()
+    test_full_vacuum_only_from_command_line()
+    test_retention_shorter_than_a_week_rejected()
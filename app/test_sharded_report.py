@@ -0,0 +1,214 @@
+import os
+from datetime import datetime, timezone, timedelta, time as dtime
+
+import pandas as pd
+from sqlalchemy import func
+
+from app.models import ReportStatus, ReportShard, StoreStatus, StoreTimezone, BusinessHours
+from app.sharded_report import (
+    HASH_SPACE,
+    hash_ranges,
+    store_hash,
+    create_shards,
+    requeue_stale_shards,
+    finalize_report,
+)
+from app.store_metadata import refresh_store_metadata
+from app.testing import temp_database, start_worker, stop_processes, wait_until
+
+
+def test_hash_ranges_cover_every_store():
+    """Every store id falls in exactly one shard and the ranges cover the whole hash space"""
+    ranges = hash_ranges(7)
+    assert ranges[0][0] == 0 and ranges[-1][1] == HASH_SPACE
+    assert all(ranges[i][1] == ranges[i + 1][0] for i in range(len(ranges) - 1))
+
+    for n in range(200):
+        h = store_hash(f"store-{n:03d}")
+        assert sum(start <= h < end for start, end in ranges) == 1
+
+
+def test_sharded_report_with_three_workers():
+    """
+    Distributed report on one machine.
+    This script checks:
+    1. Three `python -m app.worker` processes split a report into shards and process them.
+    2. A shard left Running by a "crashed" worker is picked up again.
+    3. The merged report has every store once and matches a single-process report, partial files are removed.
+    """
+    print("🧪 Testing sharded report with three workers...")
+
+    with temp_database(num_stores=20) as db:
+        session = db.session
+        shared_dir = os.path.join(db.dir, "shared")
+        now = datetime.now(timezone.utc)
+        session.add(ReportStatus(report_id="sharded", status="Queued", created_at=now))
+
+        # second report already split by a coordinator, but the worker holding
+        # shard 0 "died": only the stale shard recovery can finish it
+        session.add(ReportStatus(report_id="recovered", status="Running", created_at=now, started_at=now))
+        session.commit()
+        create_shards(session, "recovered", 4)
+        session.query(ReportShard).filter(
+            ReportShard.report_id == "recovered",
+            ReportShard.shard_index == 0
+        ).update({
+            ReportShard.status: "Running",
+            ReportShard.attempts: 1,
+            ReportShard.worker_id: "dead-node",
+            ReportShard.claimed_at: now - timedelta(hours=2),
+        }, synchronize_session=False)
+        session.commit()
+
+        env = {"REPORT_SHARDS": "4", "REPORT_SHARED_DIR": shared_dir}
+        workers = [start_worker(db, f"node-{n}", **env) for n in range(3)]
+        try:
+            def reports_done():
+                session.expire_all()
+                reports = session.query(ReportStatus).all()
+                return reports if all(r.status in ("Complete", "Error") for r in reports) else None
+
+            wait_until(reports_done)
+        finally:
+            stop_processes(workers)
+
+        recovered = session.query(ReportShard).filter(
+            ReportShard.report_id == "recovered",
+            ReportShard.shard_index == 0
+        ).one()
+        assert recovered.status == "Complete" and recovered.attempts == 2
+        assert recovered.worker_id != "dead-node"
+        assert session.query(ReportStatus).filter(ReportStatus.report_id == "recovered").one().status == "Complete"
+
+        report = session.query(ReportStatus).filter(ReportStatus.report_id == "sharded").one()
+        assert report.status == "Complete", report.status
+        shards = session.query(ReportShard).filter(ReportShard.report_id == "sharded").all()
+        assert len(shards) == 4
+        assert all(shard.status == "Complete" for shard in shards)
+        print(f"Shards per worker: {sorted((s.shard_index, s.worker_id, s.attempts) for s in shards)}")
+
+        merged = pd.read_csv(report.file_path)
+        assert len(merged) == 20 and merged["store_id"].is_unique
+        # partial CSVs are removed once merged
+        assert sorted(os.listdir(shared_dir)) == [f"store_report_{r}.csv" for r in ("recovered", "sharded")]
+
+        # same numbers as the single process report
+        single_path = db.run(
+            ["-c", "from app.report_generator import generate_report; print(generate_report())"],
+            env=db.env(**env), capture_output=True, text=True
+        ).stdout.strip().splitlines()[-1]
+        single = pd.read_csv(os.path.join(db.dir, single_path))
+        pd.testing.assert_frame_equal(
+            merged.sort_values("store_id").reset_index(drop=True),
+            single.sort_values("store_id").reset_index(drop=True)
+        )
+        print(f"✅ Merged report matches single process report ({len(merged)} stores)")
+
+
+def test_shard_out_of_attempts_fails_report():
+    """A shard that keeps timing out is marked Error after SHARD_MAX_ATTEMPTS and fails the report"""
+    with temp_database(num_stores=1) as db:
+        session = db.session
+        now = datetime.now(timezone.utc)
+        session.add(ReportStatus(report_id="r1", status="Running", created_at=now, num_shards=1))
+        session.add(ReportShard(
+            report_id="r1", shard_index=0, hash_start=0, hash_end=HASH_SPACE, current_time_utc=now,
+            store_ids="store-000", status="Running", attempts=3, claimed_at=now - timedelta(hours=2)
+        ))
+        session.commit()
+
+        requeue_stale_shards(session, timeout_seconds=60)
+        assert session.query(ReportShard).one().status == "Error"
+
+        finalize_report(session, "r1")
+        session.expire_all()
+        assert session.query(ReportStatus).one().status == "Error"
+
+
+# runs shard 1 as "node-a", which times out while it is busy: the shard is
+# re-queued and claimed by "node-b" before node-a finishes, then node-b runs it
+SLOW_SHARD_SCRIPT = """
+import app.report_generator as report_generator
+from app.database import SessionLocal
+from app.sharded_report import run_shard, claim_next_shard, requeue_stale_shards
+
+generate_partial_report = report_generator.generate_partial_report
+
+def slow_generate(store_ids, path, current_time=None):
+    session = SessionLocal()
+    requeue_stale_shards(session, timeout_seconds=0)
+    assert claim_next_shard(session, "node-b") == 1
+    session.close()
+    return generate_partial_report(store_ids, path, current_time)
+
+report_generator.generate_partial_report = slow_generate
+run_shard(1)
+report_generator.generate_partial_report = generate_partial_report
+run_shard(1)
+"""
+
+
+def test_stale_shard_finished_twice_counts_once():
+    """A shard finished by its old owner after it was re-claimed is not recorded, progress never passes the total"""
+    with temp_database(num_stores=5) as db:
+        session = db.session
+        now = datetime.now(timezone.utc)
+        session.add(ReportStatus(report_id="r1", status="Running", created_at=now, started_at=now))
+        session.commit()
+        create_shards(session, "r1", 1)
+        session.query(ReportShard).update({
+            ReportShard.status: "Running",
+            ReportShard.attempts: 1,
+            ReportShard.worker_id: "node-a",
+            ReportShard.claimed_at: now,
+        }, synchronize_session=False)
+        session.commit()
+
+        db.run(["-c", SLOW_SHARD_SCRIPT], env=db.env(REPORT_SHARED_DIR=os.path.join(db.dir, "shared")))
+
+        session.expire_all()
+        shard = session.query(ReportShard).one()
+        assert shard.status == "Complete" and shard.worker_id == "node-b" and shard.attempts == 2
+        report = session.query(ReportStatus).one()
+        assert report.status == "Complete"
+        assert report.stores_processed == report.stores_total == 5, (report.stores_processed, report.stores_total)
+
+
+def test_shards_use_coordinator_store_list():
+    """A store that appears after the report was split does not end up in some shards only"""
+    with temp_database(num_stores=6) as db:
+        session = db.session
+        now = datetime.now(timezone.utc)
+        session.add(ReportStatus(report_id="r1", status="Running", created_at=now, started_at=now))
+        session.commit()
+        create_shards(session, "r1", 3)
+        shard_stores = [store_id for s in session.query(ReportShard) for store_id in s.store_ids.split("\n") if store_id]
+        assert sorted(shard_stores) == [f"store-{n:03d}" for n in range(6)]
+
+        # new store shows up (and gets into store_metadata) while the shards are queued
+        latest = session.query(func.max(StoreStatus.timestamp_utc)).scalar()
+        session.add(StoreTimezone(store_id="store-new", timezone_str="America/Chicago"))
+        session.add(BusinessHours(store_id="store-new", day_of_week=latest.weekday(),
+                                  start_time_local=dtime(0, 0), end_time_local=dtime(23, 59, 59)))
+        session.add(StoreStatus(store_id="store-new", status="active", timestamp_utc=latest))
+        session.commit()
+        refresh_store_metadata(session)
+
+        db.run(["-m", "app.worker", "--worker-id", "node-a", "--exit-when-idle"],
+               env=db.env(REPORT_SHARED_DIR=os.path.join(db.dir, "shared")))
+
+        session.expire_all()
+        report = session.query(ReportStatus).one()
+        assert report.status == "Complete"
+        assert report.stores_processed == report.stores_total == 6
+        merged = pd.read_csv(report.file_path)
+        assert sorted(merged["store_id"]) == [f"store-{n:03d}" for n in range(6)]
+
+
+if __name__ == "__main__":
+    # run the tests
+    test_hash_ranges_cover_every_store()
+    test_sharded_report_with_three_workers()
+    test_shard_out_of_attempts_fails_report()
+    test_stale_shard_finished_twice_counts_once()
+    test_shards_use_coordinator_store_list()
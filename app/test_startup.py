@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+
+# project root, so the subprocess can import the app package
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that should only be loaded once a report actually runs
+HEAVY_MODULES = ("pandas", "numpy")
+
+# cumulative import time budget for app.main, override with STARTUP_BUDGET_MS on slow machines
+STARTUP_BUDGET_MS = int(os.getenv("STARTUP_BUDGET_MS", "3000"))
+
+
+def measure_import(module: str):
+    """
+    Import a module in a fresh interpreter with `python -X importtime`.
+    Returns {imported module name: cumulative import time in microseconds}.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    timings = {}
+    # lines look like: "import time:  self [us] | cumulative | imported package"
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def test_api_startup_is_lazy():
+    """
+    Startup benchmark for the API process.
+    This script checks:
+    1. importing app.main does not pull in pandas/numpy.
+    2. importing app.background_tasks does not pull them in either.
+    3. app.main imports within the time budget.
+    """
+    print("🧪 Measuring API startup imports...")
+
+    timings = measure_import("app.main")
+    loaded_heavy = [m for m in HEAVY_MODULES if m in timings]
+    assert not loaded_heavy, f"app.main imports {loaded_heavy} at startup"
+
+    background = measure_import("app.background_tasks")
+    loaded_heavy = [m for m in HEAVY_MODULES if m in background]
+    assert not loaded_heavy, f"app.background_tasks imports {loaded_heavy} at import time"
+
+    startup_ms = timings["app.main"] / 1000
+    print(f"app.main import time: {startup_ms:.1f} ms (budget {STARTUP_BUDGET_MS} ms)")
+    slowest = sorted(timings.items(), key=lambda item: item[1], reverse=True)[:10]
+    for name, cumulative in slowest:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    assert startup_ms < STARTUP_BUDGET_MS, f"app.main took {startup_ms:.1f} ms to import"
+
+
+if __name__ == "__main__":
+    # run the test
+    test_api_startup_is_lazy()
@@ -0,0 +1,161 @@
+import threading
+from collections import Counter
+from datetime import timedelta, time as dtime
+
+from sqlalchemy import event, func
+
+from app.models import StoreStatus, BusinessHours, StoreTimezone, StoreMetadata, StoreDailyPolls
+from app.store_metadata import refresh_store_metadata, get_report_store_ids
+from app.uptime_calculator import UptimeCalculator
+from app.testing import temp_database, SEED_NOW
+
+
+def metadata_matches_store_status(session):
+    """store_metadata and store_daily_polls agree with a GROUP BY over store_status"""
+    expected = {
+        store_id: (first, last, count)
+        for store_id, first, last, count in session.query(
+            StoreStatus.store_id,
+            func.min(StoreStatus.timestamp_utc),
+            func.max(StoreStatus.timestamp_utc),
+            func.count()
+        ).group_by(StoreStatus.store_id)
+    }
+    actual = {
+        row.store_id: (row.first_poll_utc, row.last_poll_utc, row.poll_count)
+        for row in session.query(StoreMetadata)
+    }
+    assert actual == expected, (actual, expected)
+
+    daily_total = session.query(func.sum(StoreDailyPolls.poll_count)).scalar()
+    assert daily_total == session.query(StoreStatus).count()
+
+
+def test_incremental_late_and_concurrent_refresh():
+    """
+    Incremental store metadata refresh.
+    This script checks:
+    1. New polls are added incrementally with the same result as a full rebuild.
+    2. A late poll (timestamp older than everything known) of a new store is picked up.
+    3. Two refreshes running at the same time count new polls only once.
+    """
+    print("🧪 Testing store metadata refresh...")
+
+    with temp_database(num_stores=3) as db:
+        session = db.session
+        now = SEED_NOW
+
+        assert refresh_store_metadata(session) == "full"
+        assert refresh_store_metadata(session) == "fresh"
+        metadata_matches_store_status(session)
+
+        # 1. newer polls
+        session.add(StoreStatus(store_id="store-000", status="active", timestamp_utc=now + timedelta(hours=1)))
+        session.commit()
+        assert refresh_store_metadata(session) == "incremental"
+        metadata_matches_store_status(session)
+
+        # 2. late poll of a new store, older than the current watermark
+        late = now - timedelta(days=3)
+        session.add(StoreTimezone(store_id="store-late", timezone_str="America/Chicago"))
+        session.add(BusinessHours(store_id="store-late", day_of_week=late.weekday(),
+                                  start_time_local=dtime(0, 0), end_time_local=dtime(23, 59, 59)))
+        session.add(StoreStatus(store_id="store-late", status="active", timestamp_utc=late))
+        # and a late poll of a known store, older than its first poll
+        session.add(StoreStatus(store_id="store-001", status="active", timestamp_utc=now - timedelta(days=30)))
+        session.commit()
+        assert refresh_store_metadata(session) == "incremental"
+        metadata_matches_store_status(session)
+        assert "store-late" in get_report_store_ids(session)
+        print("✅ Late polls picked up")
+
+        # 3. two refreshes racing for the same new poll
+        session.add(StoreStatus(store_id="store-002", status="inactive", timestamp_utc=now + timedelta(hours=2)))
+        session.commit()
+
+        barrier = threading.Barrier(2)
+        modes = []
+
+        def refresh():
+            thread_session = db.Session()
+            try:
+                barrier.wait()
+                modes.append(refresh_store_metadata(thread_session))
+            finally:
+                thread_session.close()
+
+        threads = [threading.Thread(target=refresh) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(modes) == ["fresh", "incremental"], modes
+        session.expire_all()
+        metadata_matches_store_status(session)
+        print("✅ Concurrent refreshes counted new polls once")
+
+
+
+# store -> poll times relative to the report's current time (SEED_NOW)
+GAP_STORES = {
+    "store-hour-gap": [-timedelta(hours=h) for h in range(3, 24 * 7, 3)],  # nothing in the last hour
+    "store-day-gap": [-timedelta(days=d) for d in (3, 4, 6)],  # nothing in the last day
+    "store-silent": [-timedelta(days=d) for d in (9, 10)],  # nothing in the last week
+    # polls after the pinned current time (as for report shards): last hour/day are inside
+    # first..last poll, only the daily counts show there is nothing in them
+    "store-later": [-timedelta(days=6), timedelta(days=2)],
+}
+
+
+def test_stores_without_polls_skip_store_status():
+    """
+    UptimeCalculator with store metadata loaded answers windows without polls from the
+    metadata: same report rows as querying store_status every time, no store_status query
+    for those windows.
+    """
+    with temp_database(num_stores=1) as db:
+        session = db.session
+        for store_id, offsets in GAP_STORES.items():
+            session.add_all(
+                StoreStatus(store_id=store_id, status="active" if n % 2 else "inactive", timestamp_utc=SEED_NOW + offset)
+                for n, offset in enumerate(offsets)
+            )
+        session.commit()
+        refresh_store_metadata(session, full=True)
+        store_ids = ["store-000", *GAP_STORES]
+
+        # store_status queries per store_id
+        queries = Counter()
+
+        def count_store_status_queries(conn, cursor, statement, parameters, context, executemany):
+            if "FROM store_status" in statement and parameters:
+                queries[parameters[0]] += 1
+
+        event.listen(session.get_bind(), "before_cursor_execute", count_store_status_queries)
+        try:
+            rows = {}
+            for use_metadata in (False, True):
+                calculator = UptimeCalculator(SEED_NOW)
+                calculator.session.close()
+                calculator.session = db.Session()
+                if use_metadata:
+                    calculator.load_store_metadata()
+                queries.clear()
+                rows[use_metadata] = [calculator.generate_report_for_store(store_id) for store_id in store_ids]
+                calculator.session.close()
+                if not use_metadata:
+                    assert all(queries[store_id] == 3 for store_id in store_ids), queries
+        finally:
+            event.remove(session.get_bind(), "before_cursor_execute", count_store_status_queries)
+
+        assert rows[True] == rows[False]
+        # queried windows: store-000 all three, store-hour-gap day + week, the others the week at most
+        assert dict(queries) == {"store-000": 3, "store-hour-gap": 2, "store-day-gap": 1, "store-later": 1}, queries
+        print("✅ Windows without polls answered from store metadata, same report rows")
+
+
+if __name__ == "__main__":
+    # run the tests
+    test_incremental_late_and_concurrent_refresh()
+    test_stores_without_polls_skip_store_status()
@@ -0,0 +1,134 @@
+import json
+import subprocess
+import sys
+from datetime import datetime, timezone, timedelta
+
+from app.models import ReportStatus
+from app.testing import temp_database, api_server, start_worker, stop_processes, http, wait_until
+
+
+def test_api_with_two_workers():
+    """
+    Integration test for the dedicated report worker.
+    This script checks:
+    1. The API only queues reports (status Queued, nothing generated in the API process).
+    2. Two `python -m app.worker` processes claim and finish all the jobs.
+    3. Every report is generated exactly once and can be downloaded from /get_report.
+    """
+    print("🧪 Testing API + two report workers...")
+
+    with temp_database(num_stores=6) as db, api_server(db, REPORT_EXECUTION="worker") as base_url:
+        report_ids = []
+        for _ in range(4):
+            _, body = http("POST", f"{base_url}/trigger_report")
+            response = json.loads(body)
+            assert response["status"] == "Queued"
+            report_ids.append(response["report_id"])
+
+        workers = [start_worker(db, name, REPORT_EXECUTION="worker") for name in ("worker-a", "worker-b")]
+        try:
+            for report_id in report_ids:
+                content_type, body = wait_until(
+                    lambda: (lambda r: r if r[0].startswith("text/csv") else None)(
+                        http("GET", f"{base_url}/get_report?report_id={report_id}")
+                    )
+                )
+                lines = body.decode().strip().splitlines()
+                assert len(lines) == 1 + 6, f"expected header + 6 stores, got {len(lines)} lines"
+                print(f"✅ Report {report_id} downloaded")
+
+        finally:
+            stop_processes(workers)
+
+        reports = db.session.query(ReportStatus).all()
+        assert all(r.status == "Complete" for r in reports)
+        assert {r.worker_id for r in reports} <= {"worker-a", "worker-b"}
+        assert len({r.file_path for r in reports}) == len(reports)
+        print(f"Jobs per worker: { {w: sum(r.worker_id == w for r in reports) for w in ('worker-a', 'worker-b')} }")
+
+
+def test_workers_start_on_new_database():
+    """Several workers started together on an empty database create the schema once, none crashes"""
+    with temp_database(schema=False) as db:
+        workers = [
+            subprocess.Popen(
+                [sys.executable, "-m", "app.worker", "--worker-id", f"worker-{n}", "--exit-when-idle"],
+                cwd=db.dir, env=db.env(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+            )
+            for n in range(4)
+        ]
+        outputs = [worker.communicate(timeout=60)[0].decode() for worker in workers]
+
+        for worker, output in zip(workers, outputs):
+            assert worker.returncode == 0, output
+        assert sum("Database schema upgraded" in output for output in outputs) == 1, outputs
+        print("✅ 4 workers started on a new database, schema created once")
+
+
+
+# report "long" runs longer than the job timeout but sends heartbeats, report "lost" is
+# re-queued and claimed by worker-b while worker-a is still generating it
+HEARTBEAT_SCRIPT = """
+import time
+import app.background_tasks as background_tasks
+import app.report_generator as report_generator
+from app.database import SessionLocal
+from app.worker import claim_next_report, requeue_stale_reports
+
+notified = []
+background_tasks.notify_report_finished = lambda report: notified.append((report.report_id, report.status))
+
+def long_report(report_id, progress_callback=None):
+    session = SessionLocal()
+    for n in range(6):
+        progress_callback(n, 6)
+        time.sleep(0.5)
+        assert requeue_stale_reports(session, timeout_seconds=1) == 0
+    session.close()
+    return "reports/long.csv"
+
+def lost_report(report_id, progress_callback=None):
+    session = SessionLocal()
+    progress_callback(0, 6)
+    assert requeue_stale_reports(session, timeout_seconds=0) == 1
+    assert claim_next_report(session, "worker-b") == report_id
+    session.close()
+    return "reports/lost.csv"
+
+session = SessionLocal()
+for report_id, generate in (("long", long_report), ("lost", lost_report)):
+    assert claim_next_report(session, "worker-a") == report_id
+    report_generator.generate_report = generate
+    background_tasks.generate_report_async(report_id)
+session.close()
+assert notified == [("long", "Complete")], notified
+"""
+
+
+def test_heartbeat_keeps_claim_and_lost_claim_writes_nothing():
+    """
+    A report running longer than the job timeout is not re-queued while its progress
+    heartbeats arrive. A run whose report was re-queued and claimed again does not write
+    Complete and does not notify (webhook).
+    """
+    with temp_database() as db:
+        session = db.session
+        created = datetime.now(timezone.utc)
+        for n, report_id in enumerate(("long", "lost")):
+            session.add(ReportStatus(report_id=report_id, status="Queued", created_at=created + timedelta(seconds=n)))
+        session.commit()
+
+        db.run(["-c", HEARTBEAT_SCRIPT], env=db.env(REPORT_PROGRESS_INTERVAL="0"))
+
+        long_report = session.query(ReportStatus).filter(ReportStatus.report_id == "long").one()
+        assert long_report.status == "Complete" and long_report.attempts == 1
+        lost = session.query(ReportStatus).filter(ReportStatus.report_id == "lost").one()
+        assert (lost.status, lost.worker_id, lost.attempts, lost.file_path) == ("Running", "worker-b", 2, None)
+        print("✅ Heartbeats keep a long report claimed, a lost claim writes nothing")
+
+
+if __name__ == "__main__":
+    # run the tests
+    test_api_with_two_workers()
+    test_workers_start_on_new_database()
+    test_heartbeat_keeps_claim_and_lost_claim_writes_nothing()
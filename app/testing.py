@@ -0,0 +1,171 @@
+"""
+Shared helpers of the app/test_*.py scripts.
+Modules use the engine built from DATABASE_URL at import time, so the tests run the
+app (API, workers, jobs) in subprocesses pointed at a temporary SQLite database.
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime, timedelta, time as dtime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import StoreStatus, BusinessHours, StoreTimezone
+
+# project root, so the subprocesses can import the app package
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# "current time" of the seeded data (latest poll)
+SEED_NOW = datetime(2023, 1, 25, 12, 0, 0)
+
+
+def make_env(database_url: str, **extra):
+    """Environment for API/worker subprocesses pointing at the test database"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = PROJECT_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env["DATABASE_URL"] = database_url
+    env.update(extra)
+    return env
+
+
+class TempDatabase:
+    """Temporary SQLite database: its directory, URL, a session factory and one open session"""
+
+    def __init__(self, directory: str, url: str, Session, session):
+        self.dir = directory
+        self.url = url
+        self.Session = Session
+        self.session = session
+
+    def env(self, **extra):
+        """make_env() for this database"""
+        return make_env(self.url, **extra)
+
+    def run(self, args: list, **kwargs):
+        """Run a python subprocess (`-m module ...` / `-c code`) against this database, in its directory"""
+        kwargs.setdefault("env", self.env())
+        if not kwargs.get("capture_output"):
+            kwargs.setdefault("stdout", subprocess.DEVNULL)
+        return subprocess.run([sys.executable, *args], cwd=self.dir, check=True, **kwargs)
+
+
+@contextmanager
+def temp_database(schema: bool = True, num_stores: int = 0):
+    """
+    Temporary directory with a new SQLite database.
+    schema: create the schema the same way app startup does (`python -m app.database`).
+    num_stores: seed that many stores with seed_stores().
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'test.db')}"
+        if schema:
+            subprocess.run([sys.executable, "-m", "app.database"], env=make_env(url), check=True,
+                           stdout=subprocess.DEVNULL)
+
+        engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 30})
+        Session = sessionmaker(bind=engine)
+        session = Session()
+        try:
+            if num_stores:
+                seed_stores(session, num_stores)
+            yield TempDatabase(tmp, url, Session, session)
+        finally:
+            session.close()
+            engine.dispose()
+
+
+def add_store(session, store_id: str, timezone_str: str = "America/Chicago"):
+    """Timezone and 24x7 business hours for a store"""
+    session.add(StoreTimezone(store_id=store_id, timezone_str=timezone_str))
+    for day in range(7):
+        session.add(BusinessHours(
+            store_id=store_id,
+            day_of_week=day,
+            start_time_local=dtime(0, 0),
+            end_time_local=dtime(23, 59, 59)
+        ))
+
+
+def seed_stores(session, num_stores: int = 6):
+    """
+    Insert a small dataset: store-000, store-001, ... with business hours,
+    a timezone and one poll per hour for the week up to SEED_NOW.
+    """
+    for n in range(num_stores):
+        store_id = f"store-{n:03d}"
+        add_store(session, store_id)
+        # one poll per hour, every third one inactive
+        for hour in range(24 * 7):
+            session.add(StoreStatus(
+                store_id=store_id,
+                status="inactive" if (hour + n) % 3 == 0 else "active",
+                timestamp_utc=SEED_NOW - timedelta(hours=hour)
+            ))
+    session.commit()
+
+
+def free_port() -> int:
+    """Ask the OS for a free TCP port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def http(method: str, url: str):
+    """Small HTTP helper, returns (content type, body)"""
+    request = urllib.request.Request(url, method=method)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.headers.get("content-type", ""), response.read()
+
+
+def wait_until(condition, timeout: float = 60, interval: float = 0.2):
+    """Call condition() until it returns something truthy or timeout runs out"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            result = condition()
+            if result:
+                return result
+        except OSError:
+            pass  # server not up yet
+        time.sleep(interval)
+    raise TimeoutError("condition not met in time")
+
+
+def start_worker(db: TempDatabase, worker_id: str, *args, **extra_env) -> subprocess.Popen:
+    """Start a `python -m app.worker` process on the database (polls every 0.2s unless args say otherwise)"""
+    args = args or ("--poll-interval", "0.2")
+    return subprocess.Popen(
+        [sys.executable, "-m", "app.worker", "--worker-id", worker_id, *args],
+        cwd=db.dir, env=db.env(**extra_env), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def stop_processes(processes: list):
+    """Terminate API/worker processes and wait for them to exit"""
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait(timeout=30)
+
+
+@contextmanager
+def api_server(db: TempDatabase, **extra_env):
+    """uvicorn running app.main against the database, yields its base URL once /health answers"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        cwd=db.dir, env=db.env(**extra_env), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until(lambda: http("GET", f"{base_url}/health"))
+        yield base_url
+    finally:
+        stop_processes([process])
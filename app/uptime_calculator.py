@@ -2,17 +2,23 @@ from datetime import datetime, timezone, timedelta
 from sqlalchemy import and_, func
 from typing import Dict, Tuple
 
-from app.models import StoreStatus, BusinessHours, StoreTimezone
+from app.models import StoreStatus, BusinessHours, StoreTimezone, StoreMetadata, StoreDailyPolls
 from app.database import SessionLocal
 
 
 class UptimeCalculator:
-    def __init__(self):
+    def __init__(self, current_time: datetime = None):
         # create db session
         self.session = SessionLocal()
+        # pin "current time" (shards of one report must all use the same one)
+        if current_time is not None:
+            self._current_timestamp = current_time
         # cache timezone and business hours for stores so we don’t hit DB again and again
         self._timezone_cache = {}
         self._business_hours_cache = {}
+        # store_metadata rows and daily poll counts, only set after load_store_metadata()
+        self._store_metadata = None
+        self._daily_polls = {}
     
     def __del__(self):
         # close db session when object is deleted
@@ -66,6 +72,50 @@ class UptimeCalculator:
         
         return self._business_hours_cache[store_id]
     
+    def load_store_metadata(self, hours_back: int = 24 * 7):
+        """
+        Load first/last poll time of every store and daily poll counts for the last
+        `hours_back` hours in two queries. After this, stores without polls in a
+        window are answered without querying store_status.
+        store_metadata must be up to date (see app.store_metadata.refresh_store_metadata).
+        """
+        start_day = (self.get_current_timestamp() - timedelta(hours=hours_back)).date()
+        
+        self._store_metadata = {
+            store_id: (first_poll, last_poll)
+            for store_id, first_poll, last_poll in self.session.query(
+                StoreMetadata.store_id, StoreMetadata.first_poll_utc, StoreMetadata.last_poll_utc
+            )
+        }
+        self._daily_polls = {}
+        for store_id, day, poll_count in self.session.query(
+            StoreDailyPolls.store_id, StoreDailyPolls.day_utc, StoreDailyPolls.poll_count
+        ).filter(StoreDailyPolls.day_utc >= start_day):
+            self._daily_polls.setdefault(store_id, {})[day] = poll_count
+    
+    def has_polls_in_range(self, store_id: str, start_time: datetime, end_time: datetime) -> bool:
+        """
+        Check from the loaded metadata if a store can have polls in [start_time, end_time].
+        Returns True when unsure (metadata not loaded, or some day in the range has polls).
+        """
+        if self._store_metadata is None:
+            return True
+        if store_id not in self._store_metadata:
+            return False
+        
+        first_poll, last_poll = self._store_metadata[store_id]
+        if last_poll < start_time or first_poll > end_time:
+            return False
+        
+        # every UTC day touched by the range has zero polls -> no polls in the range
+        daily = self._daily_polls.get(store_id, {})
+        day = start_time.date()
+        while day <= end_time.date():
+            if daily.get(day, 0) > 0:
+                return True
+            day += timedelta(days=1)
+        return False
+    
     def calculate_uptime_downtime_simple(self, store_id: str, hours_back: int) -> Dict[str, float]:
         """
         Calculate uptime/downtime for the past N hours.
@@ -75,13 +125,17 @@ class UptimeCalculator:
         start_time = current_time - timedelta(hours=hours_back)
         
         # fetch status data for this store within the time range
-        status_records = self.session.query(StoreStatus).filter(
-            and_(
-                StoreStatus.store_id == store_id,
-                StoreStatus.timestamp_utc >= start_time,
-                StoreStatus.timestamp_utc <= current_time
-            )
-        ).order_by(StoreStatus.timestamp_utc).all()
+        # (skipped when the metadata already shows there is nothing to fetch)
+        if not self.has_polls_in_range(store_id, start_time, current_time):
+            status_records = []
+        else:
+            status_records = self.session.query(StoreStatus).filter(
+                and_(
+                    StoreStatus.store_id == store_id,
+                    StoreStatus.timestamp_utc >= start_time,
+                    StoreStatus.timestamp_utc <= current_time
+                )
+            ).order_by(StoreStatus.timestamp_utc).all()
         
         if not status_records:
             # if no records found, assume full downtime
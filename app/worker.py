@@ -0,0 +1,157 @@
+import argparse
+import os
+import signal
+import socket
+import time
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import func
+
+from app.config import WORKER_POLL_INTERVAL, REPORT_JOB_TIMEOUT, REPORT_SHARDS
+from app.database import SessionLocal, ensure_schema
+from app.models import ReportStatus
+from app.sharded_report import (
+    create_shards,
+    claim_next_shard,
+    requeue_stale_shards,
+    run_shard,
+    finalize_pending_reports,
+)
+
+# set by SIGINT/SIGTERM, worker finishes its current job and exits
+_stop_requested = False
+
+
+def claim_next_report(session, worker_id: str):
+    """
+    Claim the oldest Queued report for this worker.
+    The claim is a conditional UPDATE (Queued -> Running), so when several workers
+    race for the same job only one of them gets rowcount 1.
+    Returns the claimed report_id or None if the queue is empty.
+    """
+    candidates = session.query(ReportStatus.report_id).filter(
+        ReportStatus.status == "Queued"
+    ).order_by(ReportStatus.created_at).limit(10).all()
+
+    for (report_id,) in candidates:
+        claimed = session.query(ReportStatus).filter(
+            ReportStatus.report_id == report_id,
+            ReportStatus.status == "Queued"
+        ).update({
+            ReportStatus.status: "Running",
+            ReportStatus.started_at: datetime.now(timezone.utc),
+            ReportStatus.heartbeat_at: datetime.now(timezone.utc),
+            ReportStatus.worker_id: worker_id,
+            ReportStatus.attempts: func.coalesce(ReportStatus.attempts, 0) + 1,
+        }, synchronize_session=False)
+        session.commit()
+
+        if claimed == 1:
+            return report_id
+
+    return None
+
+
+def requeue_stale_reports(session, timeout_seconds: int = REPORT_JOB_TIMEOUT) -> int:
+    """
+    Put Running reports whose worker stopped sending heartbeats for timeout_seconds back in the queue.
+    Covers workers (or API processes in thread mode) that were killed or crashed in the middle
+    of a report. A report that simply runs long keeps its heartbeat_at fresh and is left alone.
+    Sharded reports are skipped, their shards are recovered one by one (requeue_stale_shards).
+    """
+    stale_before = datetime.now(timezone.utc) - timedelta(seconds=timeout_seconds)
+    requeued = session.query(ReportStatus).filter(
+        ReportStatus.status == "Running",
+        ReportStatus.num_shards.is_(None),
+        ReportStatus.heartbeat_at < stale_before
+    ).update({
+        ReportStatus.status: "Queued",
+        ReportStatus.started_at: None,
+        ReportStatus.heartbeat_at: None,
+        ReportStatus.worker_id: None,
+    }, synchronize_session=False)
+    session.commit()
+
+    if requeued:
+        print(f"♻️ Re-queued {requeued} stale report(s)")
+    return requeued
+
+
+def _request_stop(signum, frame):
+    """Signal handler: stop after the current job"""
+    global _stop_requested
+    _stop_requested = True
+    print("🔄 Stop requested, finishing current job...")
+
+
+def run_worker(worker_id: str = None, poll_interval: float = WORKER_POLL_INTERVAL, exit_when_idle: bool = False):
+    """
+    Main worker loop.
+    Claims queued reports one at a time and generates them until stopped.
+    With REPORT_SHARDS > 1 a claimed report is split into shards instead, and
+    every worker also claims shards and runs the final merge.
+    Several workers (on one machine or many) can share the same database.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+
+    ensure_schema()
+    print(f"👷 Report worker {worker_id} started")
+
+    # imported here so the module stays cheap to import, the worker needs it on every job anyway
+    from app.background_tasks import generate_report_async
+
+    while not _stop_requested:
+        session = SessionLocal()
+        try:
+            requeue_stale_reports(session)
+            requeue_stale_shards(session)
+            finalize_pending_reports(session, worker_id)
+            # finish shards of reports already in flight before starting new reports
+            shard_id = claim_next_shard(session, worker_id)
+            report_id = None if shard_id else claim_next_report(session, worker_id)
+        finally:
+            session.close()
+
+        if shard_id is not None:
+            run_shard(shard_id)
+            continue
+
+        if report_id is None:
+            if exit_when_idle:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print(f"👷 Worker {worker_id} claimed report {report_id}")
+        if REPORT_SHARDS > 1:
+            # distributed mode: this worker only coordinates, shards are claimed by any worker
+            session = SessionLocal()
+            try:
+                create_shards(session, report_id, REPORT_SHARDS)
+            except Exception as e:
+                print(f"❌ Could not split report {report_id} into shards: {e}")
+                session.rollback()
+                session.query(ReportStatus).filter(ReportStatus.report_id == report_id).update(
+                    {ReportStatus.status: "Error", ReportStatus.completed_at: datetime.now(timezone.utc)},
+                    synchronize_session=False
+                )
+                session.commit()
+            finally:
+                session.close()
+        else:
+            generate_report_async(report_id)
+
+    print(f"👋 Report worker {worker_id} stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store monitoring report worker")
+    parser.add_argument("--worker-id", help="name shown in report_status.worker_id (default host:pid)")
+    parser.add_argument("--poll-interval", type=float, default=WORKER_POLL_INTERVAL,
+                        help="seconds to wait between queue checks when idle")
+    parser.add_argument("--exit-when-idle", action="store_true",
+                        help="exit once the queue is empty instead of waiting for new jobs")
+    args = parser.parse_args()
+
+    run_worker(args.worker_id, args.poll_interval, args.exit_when_idle)
@@ -1,55 +1,61 @@
 import pandas as pd
-from datetime import datetime
+from profile_data import build_profile, STATUS_CSV, HOURS_CSV, TIMEZONE_CSV
 
-print("📂 Loading CSV files...")
+print("📂 Profiling CSV files (streaming, see profile_data.py for JSON output)...")
 
-# Load all CSVs into pandas dataframes
-store_status = pd.read_csv('data/store_status.csv')
-business_hours = pd.read_csv('data/menu_hours.csv')  
-store_timezone = pd.read_csv('data/timezones.csv')   
+# Statistics are computed chunk by chunk, only the first rows are loaded for display
+profile = build_profile('csv')
+status = profile['store_status']
+hours = profile['business_hours']
+timezones = profile['timezones']
+overlap = profile['overlap']
 
 # ------------------------------
 # 1. STORE STATUS DATA
 # ------------------------------
 print("\n=== STORE STATUS DATA ===")
-print(f"Shape (rows, columns): {store_status.shape}")
+print(f"Rows: {status['rows']}")
 print("First 5 rows:")
-print(store_status.head())
+print(pd.read_csv(STATUS_CSV, nrows=5))
 
 # check date range of status logs
-print(f"Date range: {store_status['timestamp_utc'].min()} to {store_status['timestamp_utc'].max()}")
+print(f"Date range: {status['date_range'][0]} to {status['date_range'][1]}")
 # unique stores present
-print(f"Unique stores: {store_status['store_id'].nunique()}")
+print(f"Unique stores: {status['unique_stores']}")
 # how many active vs inactive
 print("Status distribution:")
-print(store_status['status'].value_counts())
+for name, count in status['status_distribution'].items():
+    print(f"  {name}: {count}")
+# polls per store and gaps between polls
+print(f"Polls per store: {status['polls_per_store']}")
+print(f"Gap between polls (hours): median {status['poll_gaps_hours']['median']}, "
+      f"p95 {status['poll_gaps_hours']['p95']}, max {status['poll_gaps_hours']['max']}")
+print(f"Gap histogram: {status['poll_gaps_hours']['histogram']}")
 print()
 
 # ------------------------------
 # 2. BUSINESS HOURS DATA
 # ------------------------------
 print("=== BUSINESS HOURS DATA ===")
-print(f"Shape (rows, columns): {business_hours.shape}")
+print(f"Rows: {hours['rows']}")
 print("First 5 rows:")
-print(business_hours.head())
-print(f"Unique stores: {business_hours['store_id'].nunique()}")
-
-# pick a random sample store and print its business hours
-sample_store = business_hours['store_id'].iloc[0]
-print("Sample business hours for one store:")
-print(business_hours[business_hours['store_id'] == sample_store])
+print(pd.read_csv(HOURS_CSV, nrows=5))
+print(f"Unique stores: {hours['unique_stores']}")
+print(f"Stores with hours for all 7 days: {hours['stores_with_all_7_days']}")
+print(f"Stores with hours for part of the week: {hours['stores_with_partial_week']}")
 print()
 
 # ------------------------------
 # 3. STORE TIMEZONE DATA
 # ------------------------------
 print("=== TIMEZONE DATA ===")
-print(f"Shape (rows, columns): {store_timezone.shape}")
+print(f"Rows: {timezones['rows']}")
 print("First 5 rows:")
-print(store_timezone.head())
-print(f"Unique stores: {store_timezone['store_id'].nunique()}")
+print(pd.read_csv(TIMEZONE_CSV, nrows=5))
+print(f"Unique stores: {timezones['unique_stores']}")
 print("Timezone distribution:")
-print(store_timezone['timezone_str'].value_counts())
+for name, count in timezones['distribution'].items():
+    print(f"  {name}: {count}")
 print()
 
 # ------------------------------
@@ -57,23 +63,14 @@ print()
 # ------------------------------
 print("=== DATA OVERLAP ANALYSIS ===")
 
-# get all store_ids in each dataset
-status_stores = set(store_status['store_id'].unique())
-hours_stores = set(business_hours['store_id'].unique())
-timezone_stores = set(store_timezone['store_id'].unique())
-
-print(f"Stores in status data: {len(status_stores)}")
-print(f"Stores in business hours: {len(hours_stores)}")
-print(f"Stores in timezone data: {len(timezone_stores)}")
+print(f"Stores in status data: {overlap['stores_in_status']}")
+print(f"Stores in business hours: {overlap['stores_in_business_hours']}")
+print(f"Stores in timezone data: {overlap['stores_in_timezones']}")
+print(f"Status stores without business hours (treated as 24x7): {overlap['status_stores_missing_business_hours']}")
+print(f"Status stores without timezone (treated as America/Chicago): {overlap['status_stores_missing_timezone']}")
 
-# find stores which exist in all 3 datasets
-common_all = status_stores & hours_stores & timezone_stores
-print(f"Stores present in ALL three datasets: {len(common_all)}")
+# stores which exist in all 3 datasets
+print(f"Stores present in ALL three datasets: {overlap['stores_in_all_three']}")
 
-# print one example store if overlap exists
-if len(common_all) > 0:
-    print(f"✅ Sample store present in all datasets: {list(common_all)[0]}")
-else:
+if overlap['stores_in_all_three'] == 0:
     print("⚠️ WARNING: No stores present in all three datasets!")
-
-
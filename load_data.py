@@ -2,8 +2,10 @@ import pandas as pd
 from datetime import datetime, timezone
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import insert   
-from app.database import engine, create_tables
+from app.database import engine, ensure_schema
 from app.models import StoreStatus, BusinessHours, StoreTimezone
+from app.store_metadata import refresh_store_metadata
+from app.incidents import rebuild_incidents
 import pytz
 
 
@@ -167,13 +169,23 @@ def verify_data_loaded():
 if __name__ == "__main__":
     # Create tables before inserting data
     print("Creating database tables...")
-    create_tables()
+    ensure_schema()
     
     print("Starting data loading process...")
     load_store_timezones()    # Load smallest file first
     load_business_hours()     # Load business hours second
     load_store_status()       # Load large status file last
     
+    # Build per store metadata used by the report to skip stores without data
+    session = sessionmaker(bind=engine)()
+    try:
+        refresh_store_metadata(session, full=True)
+    finally:
+        session.close()
+
+    # Extract downtime incidents from the loaded polls
+    rebuild_incidents()
+    
     # Verify record counts
     verify_data_loaded()
     print("\n🎉 All data loading complete!")
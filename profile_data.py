@@ -0,0 +1,375 @@
+import argparse
+import io
+import json
+import os
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+STATUS_CSV = 'data/store_status.csv'
+HOURS_CSV = 'data/menu_hours.csv'
+TIMEZONE_CSV = 'data/timezones.csv'
+
+CHUNK_SIZE = 200000  # rows per chunk, bounds memory of a single step
+PARTITION_BYTES = 64 * 1024 * 1024  # CSV bytes per store partition that is sorted in memory
+# poll gap buckets for the histogram, in hours
+GAP_BUCKETS = [(0, 1), (1, 2), (2, 6), (6, 24), (24, None)]
+
+
+class StatusProfile:
+    """
+    Mergeable statistics for store status polls, in O(stores) memory.
+    Polls have to be added in store_id, timestamp_utc order (see add_sorted_chunk).
+    Only running state is kept: poll count and largest gap per store, the previous
+    poll (a store may continue in the next chunk) and a count of every gap length
+    in seconds, which is bounded by the time span of the data, not the row count.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.status_counts = Counter()
+        self.poll_counts = Counter()  # store_id -> polls
+        self.max_gaps = {}  # store_id -> largest gap in seconds
+        self.gap_counts = Counter()  # gap in seconds -> number of gaps
+        self.min_ts = None
+        self.max_ts = None
+        self._last = None  # (store_id, seconds) of the previous poll
+
+    @property
+    def store_ids(self) -> list:
+        return list(self.poll_counts)
+
+    def add_sorted_chunk(self, chunk: pd.DataFrame):
+        """Add one chunk with store_id, status, timestamp_utc columns, sorted by store then time"""
+        if chunk.empty:
+            return
+        self.rows += len(chunk)
+        self.status_counts.update(chunk['status'].value_counts().to_dict())
+        self.poll_counts.update(chunk['store_id'].value_counts().to_dict())
+
+        store = chunk['store_id'].to_numpy()
+        ts = parse_timestamps(chunk['timestamp_utc'])
+        self.min_ts = ts.min() if self.min_ts is None else min(self.min_ts, ts.min())
+        self.max_ts = ts.max() if self.max_ts is None else max(self.max_ts, ts.max())
+
+        # gaps are differences between neighbours of the same store, incl. the previous chunk's last poll
+        if self._last is not None:
+            store = np.concatenate([[self._last[0]], store])
+            ts = np.concatenate([[self._last[1]], ts])
+        self._last = (store[-1], ts[-1])
+        same_store = store[1:] == store[:-1]
+        gaps = (ts[1:] - ts[:-1])[same_store]
+        if not len(gaps):
+            return
+
+        values, counts = np.unique(gaps, return_counts=True)
+        self.gap_counts.update(dict(zip(values.tolist(), counts.tolist())))
+        for store_id, gap in pd.Series(gaps).groupby(store[1:][same_store]).max().items():
+            self.max_gaps[store_id] = max(self.max_gaps.get(store_id, 0), int(gap))
+
+    def merge(self, other: "StatusProfile"):
+        """Merge the statistics of another partial profile (with other stores) into this one"""
+        self.rows += other.rows
+        self.status_counts.update(other.status_counts)
+        self.poll_counts.update(other.poll_counts)
+        self.gap_counts.update(other.gap_counts)
+        for store_id, gap in other.max_gaps.items():
+            self.max_gaps[store_id] = max(self.max_gaps.get(store_id, 0), gap)
+        for value in (other.min_ts, other.max_ts):
+            if value is not None:
+                self.min_ts = value if self.min_ts is None else min(self.min_ts, value)
+                self.max_ts = value if self.max_ts is None else max(self.max_ts, value)
+
+    def summary(self, top: int = 10, per_store: bool = False) -> dict:
+        """Final statistics: date range, poll counts per store and gaps between polls"""
+        if not self.rows:
+            return {'rows': 0}
+
+        poll_counts = np.array(list(self.poll_counts.values()))
+        gap_values = np.array(sorted(self.gap_counts))
+        gap_counts = np.array([self.gap_counts[v] for v in gap_values])
+
+        histogram = {}
+        for low, high in GAP_BUCKETS:
+            in_bucket = gap_values >= low * 3600 if high is None else \
+                (gap_values >= low * 3600) & (gap_values < high * 3600)
+            label = f"{low}h+" if high is None else f"{low}-{high}h"
+            histogram[label] = int(gap_counts[in_bucket].sum())
+
+        def max_gap_hours(store_id):
+            return round(self.max_gaps.get(store_id, 0) / 3600, 3)
+
+        # largest gap first, store id breaks ties so the result does not depend on read order
+        worst = sorted(self.poll_counts, key=lambda store_id: (-self.max_gaps.get(store_id, 0), store_id))[:top]
+        has_gaps = len(gap_values) > 0
+        result = {
+            'rows': self.rows,
+            'date_range': [to_iso(self.min_ts), to_iso(self.max_ts)],
+            'unique_stores': len(self.poll_counts),
+            'status_distribution': dict(self.status_counts),
+            'polls_per_store': {
+                'min': int(poll_counts.min()),
+                'median': float(np.median(poll_counts)),
+                'mean': round(float(poll_counts.mean()), 2),
+                'max': int(poll_counts.max()),
+            },
+            'poll_gaps_hours': {
+                'median': round(percentile_from_counts(gap_values, gap_counts, 50) / 3600, 3) if has_gaps else None,
+                'p95': round(percentile_from_counts(gap_values, gap_counts, 95) / 3600, 3) if has_gaps else None,
+                'max': round(float(gap_values[-1]) / 3600, 3) if has_gaps else None,
+                'histogram': histogram,
+            },
+            'largest_gap_stores': [
+                {'store_id': store_id, 'max_gap_hours': max_gap_hours(store_id),
+                 'polls': int(self.poll_counts[store_id])}
+                for store_id in worst
+            ],
+        }
+        if per_store:
+            result['per_store'] = {
+                store_id: {'polls': int(polls), 'max_gap_hours': max_gap_hours(store_id)}
+                for store_id, polls in self.poll_counts.items()
+            }
+        return result
+
+
+def percentile_from_counts(values: np.ndarray, counts: np.ndarray, q: float) -> float:
+    """
+    Percentile of a dataset given as sorted distinct values and their counts.
+    Same linear interpolation as np.percentile on the expanded data.
+    """
+    cumulative = np.cumsum(counts)
+    position = q / 100 * (cumulative[-1] - 1)
+    low, high = int(np.floor(position)), int(np.ceil(position))
+    low_value = values[np.searchsorted(cumulative, low, side='right')]
+    high_value = values[np.searchsorted(cumulative, high, side='right')]
+    return float(low_value + (high_value - low_value) * (position - low))
+
+
+def parse_timestamps(values: pd.Series) -> np.ndarray:
+    """Parse timestamps like '2023-01-22 12:09:39.388884 UTC' to int64 seconds since epoch"""
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        values = pd.to_datetime(values.astype(str).str.replace(' UTC', '', regex=False), format='ISO8601')
+    return values.to_numpy().astype('datetime64[s]').astype(np.int64)
+
+
+def to_iso(seconds) -> str:
+    """int seconds since epoch -> ISO string in UTC"""
+    return datetime.fromtimestamp(int(seconds), tz=timezone.utc).isoformat()
+
+
+# ------------------------------
+# Readers
+# ------------------------------
+
+def split_file(path: str, parts: int) -> list:
+    """Split a file into (start, end) byte ranges, one per worker"""
+    size = os.path.getsize(path)
+    step = max(size // parts, 1)
+    bounds = [min(i * step, size) for i in range(parts)] + [size]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i] < bounds[i + 1]]
+
+
+def iter_csv_range(path: str, start: int, end: int, chunk_size: int = CHUNK_SIZE):
+    """
+    Read the lines of a CSV whose first byte is in [start, end) as DataFrame chunks.
+    A line that crosses `start` belongs to the previous range, so ranges never overlap.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        if start > len(header):
+            f.seek(start - 1)
+            f.readline()  # finish the line that started in the previous range
+        else:
+            f.seek(len(header))
+
+        lines = []
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            lines.append(line)
+            if len(lines) == chunk_size:
+                yield pd.read_csv(io.BytesIO(header + b''.join(lines)))
+                lines = []
+        if lines:
+            yield pd.read_csv(io.BytesIO(header + b''.join(lines)))
+
+
+def _partition_csv_range(path: str, start: int, end: int, out_dir: str, partitions: int, range_index: int):
+    """
+    Pass 1 worker: append the rows of one byte range to per store partition files.
+    The partition is a hash of store_id, so all polls of a store end up in the same partition.
+    """
+    for chunk in iter_csv_range(path, start, end):
+        chunk = chunk[['store_id', 'status', 'timestamp_utc']]
+        partition = pd.util.hash_pandas_object(chunk['store_id'], index=False).to_numpy() % partitions
+        for p, rows in chunk.groupby(partition):
+            part_path = os.path.join(out_dir, f"part-{p:04d}-{range_index:04d}.csv")
+            rows.to_csv(part_path, mode='a', header=not os.path.exists(part_path), index=False)
+
+
+def _profile_partition(part_paths: list) -> StatusProfile:
+    """Pass 2 worker: load one partition (every poll of its stores), sort it by store and time and profile it"""
+    profile = StatusProfile()
+    if not part_paths:
+        return profile
+    polls = pd.concat([pd.read_csv(part_path) for part_path in part_paths], ignore_index=True)
+    polls['timestamp_utc'] = pd.to_datetime(parse_timestamps(polls['timestamp_utc']), unit='s')
+    profile.add_sorted_chunk(polls.sort_values(['store_id', 'timestamp_utc'], kind='stable'))
+    return profile
+
+
+def profile_status_csv(path: str = STATUS_CSV, workers: int = 1) -> StatusProfile:
+    """
+    Profile the status CSV with bounded memory. The file is not sorted, so:
+    1. rows are hash partitioned by store into temporary files, chunk by chunk
+       (optionally in parallel over byte ranges),
+    2. every partition, about PARTITION_BYTES of CSV, is sorted and profiled on its own
+       (optionally in parallel), and the small per store results are merged.
+    The number of partitions only depends on the file size, so the result is the same for any `workers`.
+    """
+    partitions = max(1, -(-os.path.getsize(path) // PARTITION_BYTES))
+    ranges = split_file(path, max(workers, 1))
+    profile = StatusProfile()
+
+    with tempfile.TemporaryDirectory(prefix="profile_") as tmp:
+        _run_parallel(_partition_csv_range, [
+            (path, start, end, tmp, partitions, i) for i, (start, end) in enumerate(ranges)
+        ], workers)
+
+        part_files = sorted(os.listdir(tmp))
+        partition_paths = [
+            ([os.path.join(tmp, name) for name in part_files if name.startswith(f"part-{p:04d}-")],)
+            for p in range(partitions)
+        ]
+        for partial in _run_parallel(_profile_partition, partition_paths, workers):
+            profile.merge(partial)
+
+    return profile
+
+
+def _run_parallel(func, args_list: list, workers: int) -> list:
+    """Call func for every argument tuple, in a process pool when workers > 1"""
+    if workers <= 1 or len(args_list) <= 1:
+        return [func(*args) for args in args_list]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, *zip(*args_list)))
+
+
+def profile_status_db(chunk_size: int = CHUNK_SIZE) -> StatusProfile:
+    """Profile the store_status table by streaming it in store/time order (store/time index)"""
+    from sqlalchemy import select
+    from app.database import SessionLocal
+    from app.models import StoreStatus
+
+    profile = StatusProfile()
+    session = SessionLocal()
+    try:
+        result = session.execute(
+            select(StoreStatus.store_id, StoreStatus.status, StoreStatus.timestamp_utc)
+            .order_by(StoreStatus.store_id, StoreStatus.timestamp_utc)
+            .execution_options(stream_results=True)
+        )
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            profile.add_sorted_chunk(pd.DataFrame.from_records(rows, columns=['store_id', 'status', 'timestamp_utc']))
+    finally:
+        session.close()
+    return profile
+
+
+def read_small_table(source: str, csv_path: str, model, columns: dict) -> pd.DataFrame:
+    """
+    Read business hours / timezones (small tables) from CSV or DB.
+    columns maps output column name -> CSV column name (DB uses the output name).
+    """
+    if source == 'csv':
+        df = pd.concat(pd.read_csv(csv_path, usecols=list(columns.values()), chunksize=CHUNK_SIZE))
+        return df.rename(columns={v: k for k, v in columns.items()})
+
+    from app.database import SessionLocal
+    session = SessionLocal()
+    try:
+        rows = session.query(*[getattr(model, name) for name in columns]).all()
+    finally:
+        session.close()
+    return pd.DataFrame.from_records(rows, columns=list(columns))
+
+
+# ------------------------------
+# Profile
+# ------------------------------
+
+def build_profile(source: str = 'csv', workers: int = 1, per_store: bool = False) -> dict:
+    """
+    Profile all three datasets and their overlap.
+    source = 'csv' reads the files under data/, 'db' reads the loaded tables.
+    """
+    from app.models import BusinessHours, StoreTimezone
+
+    if source == 'csv':
+        status = profile_status_csv(STATUS_CSV, workers)
+    else:
+        status = profile_status_db()
+
+    hours = read_small_table(source, HOURS_CSV, BusinessHours, {
+        'store_id': 'store_id', 'day_of_week': 'dayOfWeek',
+    })
+    timezones = read_small_table(source, TIMEZONE_CSV, StoreTimezone, {
+        'store_id': 'store_id', 'timezone_str': 'timezone_str',
+    })
+
+    status_stores = set(status.store_ids)
+    hours_stores = set(hours['store_id'].unique())
+    timezone_stores = set(timezones['store_id'].unique())
+    days_per_store = hours.groupby('store_id')['day_of_week'].nunique()
+
+    return {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'source': source,
+        'store_status': status.summary(per_store=per_store),
+        'business_hours': {
+            'rows': len(hours),
+            'unique_stores': len(hours_stores),
+            'stores_with_all_7_days': int((days_per_store == 7).sum()),
+            'stores_with_partial_week': int((days_per_store < 7).sum()),
+        },
+        'timezones': {
+            'rows': len(timezones),
+            'unique_stores': len(timezone_stores),
+            'distribution': timezones['timezone_str'].value_counts().to_dict(),
+        },
+        'overlap': {
+            'stores_in_status': len(status_stores),
+            'stores_in_business_hours': len(hours_stores),
+            'stores_in_timezones': len(timezone_stores),
+            'stores_in_all_three': len(status_stores & hours_stores & timezone_stores),
+            # stores that fall back to defaults in the uptime calculation
+            'status_stores_missing_business_hours': len(status_stores - hours_stores),
+            'status_stores_missing_timezone': len(status_stores - timezone_stores),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming profiler for the store monitoring datasets")
+    parser.add_argument('--source', choices=['csv', 'db'], default='csv', help="read CSV files or the loaded database")
+    parser.add_argument('--workers', type=int, default=1, help="processes used to read store_status.csv in parallel")
+    parser.add_argument('--per-store', action='store_true', help="include poll count and max gap of every store")
+    parser.add_argument('--output', help="write the JSON profile to this file instead of stdout")
+    args = parser.parse_args()
+
+    profile = build_profile(args.source, args.workers, args.per_store)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(profile, f, indent=2)
+        print(f"✅ Profile written to {args.output}")
+    else:
+        print(json.dumps(profile, indent=2))